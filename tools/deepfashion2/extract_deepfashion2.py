@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Extract DeepFashion2 encrypted zip bundles in parallel.
+
+Replacement for extract_deepfashion2.sh, which runs `unzip` over each
+archive serially. Here the entries of train.zip / validation.zip / test.zip
+(and json_for_validation.zip if present) are split into chunks of about
+--chunk-mb compressed bytes and decrypted by a process pool. Each worker
+opens its own handle on the archive. AES decryption and inflate are CPU
+bound, so this scales with cores until the disk saturates.
+
+Entries already on disk with the right size are skipped, so an interrupted
+run resumes where it stopped. --check-crc also compares the CRC-32 of the
+existing file, which costs a read of everything already extracted. WinZip
+AE-2 entries store no CRC (they are authenticated by HMAC instead), so those
+are checked by size only. Files are written to a temp name and renamed when
+complete, so a partial file never looks extracted.
+
+Usage:
+  python3 tools/deepfashion2/extract_deepfashion2.py \
+    /path/to/DeepFashion2_zips \
+    Datasets/DeepFashion2 \
+    --workers 8
+
+Password: --password, else env DEEPFASHION2_ZIP_PASSWORD, else prompt (the same
+lookup as the tools/ml converters, via tools/ml/zip_entries.py).
+
+Exit codes:
+- 0: everything extracted (or already present)
+- 2: missing inputs / bad args
+- 3: one or more entries failed to decrypt/extract
+
+Requires: pyzipper
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+# Password lookup and archive opening are shared with the tools/ml converters.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "ml"))
+from zip_entries import open_zip, zip_password  # noqa: E402
+
+if TYPE_CHECKING:
+    import pyzipper
+
+
+ZIP_NAMES = ["train.zip", "validation.zip", "test.zip"]
+OPTIONAL_ZIPS = ["json_for_validation.zip"]
+
+_COPY_BUF = 1 << 20
+
+# Per-process archive handles, opened on first use by each worker.
+_HANDLES: dict[str, pyzipper.AESZipFile] = {}
+
+
+def archive_handle(zip_path: str, password: bytes) -> pyzipper.AESZipFile:
+    """This process's open handle on `zip_path` (opened on first use, then reused)."""
+    zf = _HANDLES.get(zip_path)
+    if zf is None:
+        zf = open_zip(Path(zip_path), password)
+        _HANDLES[zip_path] = zf
+    return zf
+
+
+def safe_dest(dst_root: Path, name: str) -> Path | None:
+    """Destination for entry `name`, or None if it would escape dst_root."""
+    parts = Path(name).parts
+    if not parts or Path(name).is_absolute() or ".." in parts:
+        return None
+    return dst_root.joinpath(*parts)
+
+
+def file_crc32(path: Path) -> int:
+    crc = 0
+    with path.open("rb") as f:
+        while chunk := f.read(_COPY_BUF):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def has_crc(info) -> bool:
+    """False for WinZip AE-2 entries, whose CRC field is always 0."""
+    return not (getattr(info, "wz_aes_version", None) == 2 and info.CRC == 0)
+
+
+def _already_extracted(dest: Path, info, check_crc: bool) -> bool:
+    try:
+        if dest.stat().st_size != info.file_size:
+            return False
+    except FileNotFoundError:
+        return False
+    return not (check_crc and has_crc(info)) or file_crc32(dest) == info.CRC
+
+
+def _extract_chunk(zip_path: str, password: bytes, names: list[str], dst_root: str) -> tuple[int, int, list[str]]:
+    """Extract `names` from the archive. Returns (files, bytes, errors)."""
+    zf = archive_handle(zip_path, password)
+    root = Path(dst_root)
+    files = 0
+    nbytes = 0
+    errors: list[str] = []
+    for name in names:
+        dest = safe_dest(root, name)
+        info = zf.getinfo(name)
+        tmp = dest.with_name(dest.name + ".part")
+        try:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            with zf.open(info) as src, tmp.open("wb") as out:
+                shutil.copyfileobj(src, out, _COPY_BUF)
+            os.replace(tmp, dest)
+            mtime = datetime(*info.date_time).timestamp()
+            os.utime(dest, (mtime, mtime))
+        except Exception as e:  # noqa: BLE001 - report and keep going
+            tmp.unlink(missing_ok=True)
+            errors.append(f"{name}: {type(e).__name__}: {e}")
+            continue
+        files += 1
+        nbytes += info.file_size
+    return files, nbytes, errors
+
+
+def plan_chunks(infos: list, chunk_bytes: int) -> list[list[str]]:
+    """Group entries into chunks of about `chunk_bytes` compressed bytes (archive order)."""
+    chunks: list[list[str]] = []
+    cur: list[str] = []
+    size = 0
+    for info in infos:
+        cur.append(info.filename)
+        size += info.compress_size
+        if size >= chunk_bytes:
+            chunks.append(cur)
+            cur, size = [], 0
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def check_password(zf: pyzipper.AESZipFile, entries: list, password: bytes) -> str | None:
+    """Decrypt the smallest encrypted entry; returns an error message or None."""
+    encrypted = [i for i in entries if i.flag_bits & 0x1]
+    if not encrypted:
+        return None
+    zf.setpassword(password)
+    try:
+        zf.read(min(encrypted, key=lambda i: i.compress_size))
+    except RuntimeError as e:
+        # pyzipper uses RuntimeError for bad password / CRC mismatch.
+        return f"decrypt failed: {e}"
+    return None
+
+
+def _extract_zip(zip_path: Path, dst: Path, password: bytes, ex: ProcessPoolExecutor, args) -> int:
+    """Extract one archive; returns the number of failed entries."""
+    with open_zip(zip_path) as zf:
+        entries = [i for i in zf.infolist() if not i.is_dir()]
+        err = check_password(zf, entries, password)
+    if err:
+        print(f"{zip_path.name}: FAIL - {err}")
+        return len(entries)
+
+    todo = []
+    skipped = 0
+    bad_names = 0
+    for info in entries:
+        dest = safe_dest(dst, info.filename)
+        if dest is None:
+            print(f"  refusing unsafe entry name: {info.filename}", file=sys.stderr)
+            bad_names += 1
+        elif _already_extracted(dest, info, args.check_crc):
+            skipped += 1
+        else:
+            todo.append(info)
+
+    total_bytes = sum(i.file_size for i in todo)
+    print(
+        f"{zip_path.name}: {len(entries)} entries, {skipped} already extracted, "
+        f"{len(todo)} to extract ({total_bytes / 1e6:.1f} MB)"
+    )
+    if not todo:
+        return bad_names
+
+    t0 = time.perf_counter()
+    futs = [
+        ex.submit(_extract_chunk, str(zip_path), password, names, str(dst))
+        for names in plan_chunks(todo, args.chunk_mb << 20)
+    ]
+    done_files = 0
+    done_bytes = 0
+    errors: list[str] = []
+    last = t0
+    for fut in as_completed(futs):
+        files, nbytes, errs = fut.result()
+        done_files += files
+        done_bytes += nbytes
+        errors.extend(errs)
+        now = time.perf_counter()
+        if now - last >= 5.0:
+            last = now
+            print(f"  {done_bytes / 1e6:.0f}/{total_bytes / 1e6:.0f} MB  {done_bytes / 1e6 / (now - t0):.1f} MB/s")
+    elapsed = time.perf_counter() - t0
+
+    rate = done_bytes / 1e6 / elapsed if elapsed else 0.0
+    print(f"  extracted {done_files} files, {done_bytes / 1e6:.1f} MB in {elapsed:.1f}s ({rate:.1f} MB/s)")
+    for e in errors[:20]:
+        print(f"  FAIL {e}")
+    if len(errors) > 20:
+        print(f"  ... {len(errors) - 20} more failures")
+    return len(errors) + bad_names
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("src_dir", help="Directory containing DeepFashion2 zip bundles")
+    ap.add_argument("dst_dir", help="Extraction target, e.g. Datasets/DeepFashion2")
+    ap.add_argument("--password", default="", help="Zip password (default: $DEEPFASHION2_ZIP_PASSWORD or prompt)")
+    ap.add_argument("--workers", type=int, default=0, help="Processes (0 = all cores)")
+    ap.add_argument("--chunk-mb", type=int, default=64, help="Compressed MB per work unit")
+    ap.add_argument("--check-crc", action="store_true", help="Also CRC-check files already on disk before skipping")
+    args = ap.parse_args()
+
+    src = Path(args.src_dir).expanduser().resolve()
+    if not src.is_dir():
+        print(f"Not a directory: {src}")
+        return 2
+    dst = Path(args.dst_dir).expanduser().resolve()
+    dst.mkdir(parents=True, exist_ok=True)
+
+    password_b = zip_password(args.password)
+
+    zips = []
+    for name in ZIP_NAMES:
+        if not (src / name).exists():
+            print(f"Missing: {src / name}")
+            return 2
+        zips.append(src / name)
+    zips += [src / n for n in OPTIONAL_ZIPS if (src / n).exists()]
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    failed = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for zp in zips:
+            failed += _extract_zip(zp, dst, password_b, ex, args)
+
+    print(f"Done in {time.perf_counter() - t0:.1f}s with {workers} workers. Extracted to: {dst}")
+    print(f'Next: python3 tools/deepfashion2/verify_deepfashion2.py "{dst}"')
+    return 3 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
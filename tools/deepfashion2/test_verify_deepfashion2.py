@@ -0,0 +1,64 @@
+"""Tests for verify_deepfashion2.py --deep (run: python3 -m unittest discover tools/deepfashion2)."""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import verify_deepfashion2  # noqa: E402
+
+
+def _run(root: Path, *flags: str) -> tuple[int, str]:
+    out = io.StringIO()
+    with mock.patch.object(sys, "argv", ["verify_deepfashion2.py", str(root), *flags]), contextlib.redirect_stdout(out):
+        rc = verify_deepfashion2.main()
+    return rc, out.getvalue()
+
+
+def _touch(path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+
+
+class DeepCheckTest(unittest.TestCase):
+    def test_images_only_layout_reports_orphans(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            _touch(root / "train" / "image" / "000001.jpg")
+            rc, out = _run(root, "--deep")
+        self.assertEqual(rc, 1)
+        self.assertIn("train: images without anno=1 annos without image=0", out)
+        self.assertIn("image without anno: 000001", out)
+
+    def test_complete_layout_with_unlabelled_test_split_passes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for split in ("train", "validation"):
+                _touch(root / split / "image" / "000001.jpg")
+                _touch(root / split / "annos" / "000001.json")
+            _touch(root / "test" / "image" / "000001.jpg")
+            rc, out = _run(root, "--deep")
+        self.assertEqual(rc, 0, out)
+        self.assertIn("test: images=1, no annos", out)
+
+    def test_anno_without_image(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for split in ("train", "validation"):
+                _touch(root / split / "image" / "000001.jpg")
+                _touch(root / split / "annos" / "000001.json")
+            _touch(root / "validation" / "annos" / "000002.json")
+            rc, out = _run(root, "--deep")
+        self.assertEqual(rc, 1)
+        self.assertIn("anno without image: 000002", out)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,37 +16,174 @@ This script supports either:
 - extracted folders (preferred), or
 - a folder that still contains the zip bundles (it will warn).
 
+Each image/annos directory is listed once with os.scandir, and entries are
+counted as they stream past. If no native layout is found, candidate JSON
+files are probed for COCO top-level keys by scanning a bounded prefix
+(--prefix-mb). The rest of the file is only byte-searched in chunks, never
+json-loaded, so multi-hundred-MB files cost one sequential read and no
+parse.
+
+`--deep` also cross-checks image and annotation file stems per split (the
+directories are listed in parallel) and reports orphans: images without an
+annotation, and annotations without an image. A test split without annos is
+expected and not counted.
+
 Usage:
     python3 tools/deepfashion2/verify_deepfashion2.py Datasets/DeepFashion2
+    python3 tools/deepfashion2/verify_deepfashion2.py Datasets/DeepFashion2 --deep
 """
 
 from __future__ import annotations
 
+import argparse
 import json
-import sys
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+SPLITS = ["train", "validation", "test"]
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+COCO_NAME_HINTS = ["coco", "instances", "annotations", "train", "val", "test"]
+
+# A JSON string (optionally followed by ':' when it is a key) or a bracket.
+# Strings are matched whole, so brackets inside them are never counted.
+_JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"\s*:?|[{}\[\]]')
+_SCAN_BLOCK = 8 << 20
+
+
+def scan_dir(d: Path, exts: tuple[str, ...], want_stems: bool = False) -> tuple[int, set[str] | None]:
+    """One os.scandir pass: (number of files with one of `exts`, their stems if `want_stems`)."""
+    count = 0
+    stems: set[str] | None = set() if want_stems else None
+    try:
+        it = os.scandir(d)
+    except FileNotFoundError:
+        return 0, stems
+    with it:
+        for e in it:
+            name = e.name
+            if name.lower().endswith(exts) and e.is_file():
+                count += 1
+                if stems is not None:
+                    stems.add(name.rsplit(".", 1)[0])
+    return count, stems
+
+
+def top_level_keys(path: Path, prefix_bytes: int) -> set[str]:
+    """Keys of the top-level JSON object that start within the first `prefix_bytes`."""
+    with path.open("rb") as f:
+        buf = f.read(prefix_bytes)
+    keys: set[str] = set()
+    depth = 0
+    for m in _JSON_TOKEN.finditer(buf):
+        tok = m.group()
+        if tok[:1] == b'"':
+            if depth == 1 and tok.endswith(b":"):
+                try:
+                    keys.add(json.loads(tok[:-1].rstrip()))
+                except ValueError:
+                    pass
+        elif tok in (b"{", b"["):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                break
+    return keys
+
+
+def count_markers(path: Path, markers: list[bytes]) -> dict[bytes, int]:
+    """Occurrences of each marker in the file, read in fixed-size blocks (flat memory)."""
+    counts = dict.fromkeys(markers, 0)
+    overlap = max(len(m) for m in markers) - 1
+    tail = b""
+    with path.open("rb") as f:
+        while block := f.read(_SCAN_BLOCK):
+            buf = tail + block
+            for m in markers:
+                # Matches wholly inside the carried-over tail were counted last round.
+                counts[m] += buf.count(m) - tail.count(m)
+            tail = buf[-overlap:] if overlap else b""
+    return counts
+
+
+def _iter_json_files(root: Path):
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            entries = sorted(it, key=lambda e: e.name)
+        for e in entries:
+            if e.is_dir():
+                stack.append(e.path)
+            elif e.name.lower().endswith(".json") and e.is_file():
+                yield Path(e.path)
+
 
-def _find_files(root: Path, patterns: list[str]) -> list[Path]:
-    out: list[Path] = []
-    for pat in patterns:
-        out.extend(root.rglob(pat))
-    # dedupe while preserving order
-    seen: set[Path] = set()
-    unique: list[Path] = []
-    for p in out:
-        if p not in seen:
-            seen.add(p)
-            unique.append(p)
-    return unique
+def _find_coco(root: Path, prefix_bytes: int):
+    for p in _iter_json_files(root):
+        name = p.name.lower()
+        if not any(k in name for k in COCO_NAME_HINTS):
+            continue
+        try:
+            keys = top_level_keys(p, prefix_bytes)
+            if "images" not in keys and "annotations" not in keys:
+                continue
+            counts = count_markers(p, [b'"annotations"', b'"images"', b'"file_name"', b'"bbox"', b'"supercategory"'])
+        except OSError:
+            continue
+        # A key past the prefix shows up in the byte count.
+        if counts[b'"images"'] and counts[b'"annotations"']:
+            return p, keys, counts
+    return None
 
 
-def main() -> int:
-    if len(sys.argv) != 2:
-        print("Usage: verify_deepfashion2.py <deepfashion2_root>")
-        return 2
+def _cross_check(root: Path, splits: list[str], show: int) -> int:
+    """Compare image vs annotation stems per split; returns the number of orphans.
 
-    root = Path(sys.argv[1]).expanduser().resolve()
+    A test split with images and no annos is expected (DeepFashion2 ships test
+    labels separately) and is not counted.
+    """
+    jobs = [(s, "image", IMAGE_EXTS) for s in splits] + [(s, "annos", (".json",)) for s in splits]
+    if not jobs:
+        return 0
+    with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+        listed = list(ex.map(lambda j: scan_dir(root / j[0] / j[1], j[2], want_stems=True)[1], jobs))
+    stems = {(s, kind): st for (s, kind, _), st in zip(jobs, listed)}
+
+    orphans = 0
+    print("\nDeep check (image <-> anno stems):")
+    for s in splits:
+        imgs, annos = stems[(s, "image")], stems[(s, "annos")]
+        if s == "test" and not annos:
+            print(f"  {s}: images={len(imgs):,}, no annos (test labels are not shipped)")
+            continue
+        no_anno = sorted(imgs - annos)
+        no_image = sorted(annos - imgs)
+        orphans += len(no_anno) + len(no_image)
+        print(f"  {s}: images without anno={len(no_anno):,} annos without image={len(no_image):,}")
+        for label, items in (("image without anno", no_anno), ("anno without image", no_image)):
+            for stem in items[:show]:
+                print(f"    {label}: {stem}")
+            if len(items) > show:
+                print(f"    ... {len(items) - show:,} more")
+    return orphans
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("root", help="DeepFashion2 root")
+    ap.add_argument("--deep", action="store_true", help="Cross-check image/anno stems and report orphans")
+    ap.add_argument("--show", type=int, default=10, help="--deep: orphans listed per split and kind")
+    ap.add_argument("--prefix-mb", type=float, default=1.0, help="Bytes of each JSON scanned for COCO keys")
+    args = ap.parse_args()
+
+    root = Path(args.root).expanduser().resolve()
     if not root.exists():
         print(f"Not found: {root}")
         return 2
@@ -54,33 +191,23 @@ def main() -> int:
     print(f"DeepFashion2 root: {root}")
 
     # If the user has only the zips downloaded (common), detect that quickly.
-    zip_candidates = [p for p in root.glob("*.zip") if p.is_file()]
+    zip_candidates = sorted(e for e in root.iterdir() if e.suffix == ".zip" and e.is_file())
     if zip_candidates:
         names = {p.name for p in zip_candidates}
         if {"train.zip", "validation.zip", "test.zip"}.intersection(names):
             print("\nDetected DeepFashion2 zip bundles (not extracted yet):")
-            for p in sorted(zip_candidates)[:20]:
+            for p in zip_candidates[:20]:
                 size_mb = p.stat().st_size / (1024 * 1024)
                 print(f"  - {p.name} ({size_mb:,.1f} MB)")
             print("\nThese zips are often encrypted. Extract them first (password required) then re-run this verifier.")
-            print("Repo helper: tools/deepfashion2/extract_deepfashion2.sh (in the app repo)")
+            print("Repo helper: tools/deepfashion2/extract_deepfashion2.py")
             # Continue checking extracted layout too in case both exist.
 
     # Prefer DeepFashion2 native layout checks.
-    def count_split(split: str) -> tuple[int, int]:
-        img_dir = root / split / "image"
-        anno_dir = root / split / "annos"
-        imgs = 0
-        annos = 0
-        if img_dir.exists():
-            imgs = len(list(img_dir.glob("*.jpg"))) + len(list(img_dir.glob("*.jpeg"))) + len(list(img_dir.glob("*.png")))
-        if anno_dir.exists():
-            annos = len(list(anno_dir.glob("*.json")))
-        return imgs, annos
-
-    train_imgs, train_annos = count_split("train")
-    val_imgs, val_annos = count_split("validation")
-    test_imgs, test_annos = count_split("test")
+    counts = {s: (scan_dir(root / s / "image", IMAGE_EXTS)[0], scan_dir(root / s / "annos", (".json",))[0]) for s in SPLITS}
+    train_imgs, train_annos = counts["train"]
+    val_imgs, val_annos = counts["validation"]
+    test_imgs, test_annos = counts["test"]
 
     if any([train_imgs, train_annos, val_imgs, val_annos, test_imgs]):
         print("\nExtracted DeepFashion2 layout detected:")
@@ -89,41 +216,28 @@ def main() -> int:
         print(f"  test: images={test_imgs:,} annos={test_annos:,}")
 
         ok = train_imgs > 0 and train_annos > 0 and val_imgs > 0 and val_annos > 0
+        orphans = _cross_check(root, [s for s in SPLITS if any(counts[s])], args.show) if args.deep else 0
         if not ok:
             print("\nWARNING: Some splits look incomplete (images/annos missing).")
             return 1
+        if orphans:
+            print(f"\nWARNING: {orphans:,} image/anno files have no counterpart.")
+            return 1
 
         return 0
 
     # Fallback: try COCO-style json detection if the dataset is pre-converted.
-    jsons = _find_files(root, ["*.json"])
-    candidates: list[Path] = []
-    for p in jsons:
-        name = p.name.lower()
-        if any(k in name for k in ["coco", "instances", "annotations", "train", "val", "test"]):
-            candidates.append(p)
-
-    coco: tuple[Path, dict] | None = None
-    for p in candidates:
-        try:
-            with p.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-            if isinstance(data, dict) and {"images", "annotations"}.issubset(data.keys()):
-                coco = (p, data)
-                break
-        except Exception:
-            continue
-
+    coco = _find_coco(root, int(args.prefix_mb * (1 << 20)))
     if coco:
-        p, data = coco
-        images = data.get("images", [])
-        annotations = data.get("annotations", [])
-        categories = data.get("categories", [])
+        p, keys, markers = coco
         print("\nCOCO annotation detected:")
-        print(f"  file: {p.relative_to(root)}")
-        print(f"  images: {len(images)}")
-        print(f"  annotations: {len(annotations)}")
-        print(f"  categories: {len(categories)}")
+        print(f"  file: {p.relative_to(root)} ({p.stat().st_size / (1024 * 1024):,.1f} MB)")
+        print(f"  top-level keys (prefix): {', '.join(sorted(keys))}")
+        # Marker counts, not a parse: one "file_name" per image, one "bbox" per annotation.
+        n_images, n_annos, n_cats = (markers[m] for m in (b'"file_name"', b'"bbox"', b'"supercategory"'))
+        print(f"  images: ~{n_images:,}")
+        print(f"  annotations: ~{n_annos:,}")
+        print(f"  categories: ~{n_cats:,}")
         return 0
 
     print("\nNo extracted DeepFashion2 folders detected yet (and no COCO json found).")
@@ -9,6 +9,28 @@ Writes:
 - a new outfits JSONL where each item gains:
   - local_image_relpath (relative to images_root)
   - local_image_abspath
+  Rows are validated against records.PolyvoreOutfit, but fields the schema
+  does not declare (on outfits or items) are passed through unchanged. The
+  columnar copy (--columnar) holds only the declared columns.
+
+Join modes (--join):
+- memory  load the whole item_uid -> relpath mapping into a dict (fastest, most RAM)
+- sqlite  look items up in an on-disk index (<item-images>.sqlite, or --join-db),
+          built once and rebuilt only when the mapping file changes. Memory
+          stays flat regardless of the size of the image index.
+
+`--workers N` (implies sqlite) splits the outfits file into line-aligned byte
+ranges, augments them in parallel and concatenates the parts in order, so
+the output is identical to a serial run.
+
+`--apply-delta DELTA` updates an existing outfits-with-images manifest
+(given as --outfits-in) from the delta written by index_polyvore_images.py
+--delta-out: items whose image appeared or moved gain the new paths, items
+whose image was removed lose them, and everything else passes through. The
+result equals a full re-augment against the refreshed image index.
+
+The images root is resolved once; abspaths are built by string concatenation
+(no per-item resolve() syscall).
 
 Usage:
   python3 tools/ml/augment_polyvore_outfits_with_images.py \
@@ -16,40 +38,208 @@ Usage:
     --item-images tools/_out/manifests/polyvore_item_images.jsonl \
     --images-root Datasets/polyvore_images \
     --outfits-out tools/_out/manifests/polyvore_outfits_with_images.jsonl
+
+  # after an incremental index refresh
+  python3 tools/ml/augment_polyvore_outfits_with_images.py \
+    --outfits-in tools/_out/manifests/polyvore_outfits_with_images.jsonl \
+    --apply-delta tools/_out/manifests/polyvore_item_images.delta.jsonl \
+    --images-root Datasets/polyvore_images \
+    --outfits-out tools/_out/manifests/polyvore_outfits_with_images.new.jsonl
 """
 
 from __future__ import annotations
 
 import argparse
-import json
+import os
+import shutil
+import sqlite3
+import tempfile
 from pathlib import Path
 
+from manifest_columnar import ColumnarWriter, ManifestWriter, columnar_path
+from manifest_io import JsonlWriter
+from records import ItemImage, PolyvoreOutfit, iter_records, to_dict
+
 
 def _load_item_map(path: Path) -> dict[str, str]:
     out: dict[str, str] = {}
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            obj = json.loads(line)
-            uid = obj.get("item_uid")
-            rel = obj.get("image_relpath")
-            if uid and rel:
-                out[uid] = rel
+    for rec in iter_records(path, ItemImage):
+        if rec.item_uid and rec.image_relpath:
+            out[rec.item_uid] = rec.image_relpath
+    return out
+
+
+def _source_stamp(path: Path) -> str:
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _ensure_join_db(item_images: Path, db_path: Path) -> None:
+    """(Re)build the on-disk item_uid -> relpath index unless it matches the mapping file."""
+    stamp = _source_stamp(item_images)
+    if db_path.exists():
+        try:
+            con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                row = con.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            finally:
+                con.close()
+            if row and row[0] == stamp:
+                return
+        except sqlite3.Error:
+            pass
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = db_path.with_name(db_path.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    con = sqlite3.connect(tmp)
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute("CREATE TABLE items (uid TEXT PRIMARY KEY, rel TEXT NOT NULL) WITHOUT ROWID")
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        batch: list[tuple[str, str]] = []
+        for rec in iter_records(item_images, ItemImage):
+            if rec.item_uid and rec.image_relpath:
+                batch.append((rec.item_uid, rec.image_relpath))
+            if len(batch) >= 10000:
+                # Later rows win, matching the dict built by _load_item_map.
+                con.executemany("INSERT OR REPLACE INTO items VALUES (?, ?)", batch)
+                batch = []
+        con.executemany("INSERT OR REPLACE INTO items VALUES (?, ?)", batch)
+        con.execute("INSERT INTO meta VALUES ('source', ?)", (stamp,))
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, db_path)
+
+
+class _SqliteLookup:
+    def __init__(self, db_path: Path):
+        self._con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+    def get_many(self, uids: list[str]) -> dict[str, str]:
+        if not uids:
+            return {}
+        q = "SELECT uid, rel FROM items WHERE uid IN (" + ",".join("?" * len(uids)) + ")"
+        return dict(self._con.execute(q, uids).fetchall())
+
+
+class _DictLookup:
+    def __init__(self, mapping: dict[str, str]):
+        self._map = mapping
+
+    def get_many(self, uids: list[str]) -> dict[str, str]:
+        return {u: self._map[u] for u in uids if u in self._map}
+
+
+def _load_delta(path: Path) -> dict[str, str | None]:
+    """item_uid -> new relpath, or None where the image was removed."""
+    out: dict[str, str | None] = {}
+    for rec in iter_records(path, ItemImage):
+        out[rec.item_uid] = rec.image_relpath if rec.exists else None
     return out
 
 
+def _apply_delta(outfits, delta: dict[str, str | None], root_prefix: str, write) -> tuple[int, int, int]:
+    total_outfits = 0
+    total_items = 0
+    resolved = 0
+    for o, raw in outfits:
+        for it in o.items:
+            total_items += 1
+            if it.item_uid in delta:
+                rel = delta[it.item_uid]
+                it.local_image_relpath = rel
+                it.local_image_abspath = root_prefix + rel if rel else None
+            if it.local_image_relpath:
+                resolved += 1
+        total_outfits += 1
+        write(to_dict(o, raw))
+    return total_outfits, total_items, resolved
+
+
+def _augment(outfits, lookup, root_prefix: str, write) -> tuple[int, int, int]:
+    total_outfits = 0
+    total_items = 0
+    resolved = 0
+    for o, raw in outfits:
+        found = lookup.get_many([it.item_uid for it in o.items])
+        for it in o.items:
+            total_items += 1
+            rel = found.get(it.item_uid)
+            if rel:
+                it.local_image_relpath = rel
+                it.local_image_abspath = root_prefix + rel
+                resolved += 1
+        total_outfits += 1
+        write(to_dict(o, raw))
+    return total_outfits, total_items, resolved
+
+
+def _augment_range(outfits_in: str, start: int, end: int, part: str, db_path: str, root_prefix: str):
+    lookup = _SqliteLookup(Path(db_path))
+    with JsonlWriter(Path(part)) as w:
+        outfits = iter_records(Path(outfits_in), PolyvoreOutfit, start, end, with_raw=True)
+        return _augment(outfits, lookup, root_prefix, w.write)
+
+
+def _run_parallel(outfits_in: Path, outfits_out: Path, db_path: Path, root_prefix: str, workers: int):
+    from concurrent.futures import ProcessPoolExecutor
+
+    size = outfits_in.stat().st_size
+    n_ranges = max(1, min(workers * 4, size // (1 << 20) + 1))
+    bounds = [size * i // n_ranges for i in range(n_ranges + 1)]
+    totals = [0, 0, 0]
+    with tempfile.TemporaryDirectory(dir=outfits_out.parent) as tmp:
+        parts = [str(Path(tmp) / f"part{i:05d}.jsonl") for i in range(n_ranges)]
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = [
+                ex.submit(_augment_range, str(outfits_in), bounds[i], bounds[i + 1], parts[i], str(db_path), root_prefix)
+                for i in range(n_ranges)
+            ]
+            for fut in futs:
+                for k, v in enumerate(fut.result()):
+                    totals[k] += v
+        with outfits_out.open("wb") as out:
+            for p in parts:
+                with open(p, "rb") as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+    return tuple(totals)
+
+
+def _report(total_outfits: int, total_items: int, resolved: int, outfits_out: Path) -> int:
+    pct = (resolved / total_items * 100.0) if total_items else 0.0
+    print(f"Outfits: {total_outfits}")
+    print(f"Items: {total_items}")
+    print(f"Resolved images: {resolved} ({pct:.1f}%)")
+    print(f"Wrote: {outfits_out}")
+    return 0
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--outfits-in", required=True)
-    ap.add_argument("--item-images", required=True)
+    ap.add_argument("--item-images", default="", help="Item image mapping JSONL (not used with --apply-delta)")
     ap.add_argument("--images-root", required=True)
     ap.add_argument("--outfits-out", required=True)
+    ap.add_argument(
+        "--columnar",
+        choices=["arrow", "parquet"],
+        default="",
+        help="Also write each manifest as .arrow/.parquet next to the JSONL (needs pyarrow)",
+    )
+    ap.add_argument("--join", choices=["memory", "sqlite"], default="memory", help="How to look up item images")
+    ap.add_argument("--join-db", default="", help="sqlite index path (default: <item-images>.sqlite)")
+    ap.add_argument("--workers", type=int, default=1, help="Parallel outfit chunks (0 = all cores; >1 implies sqlite)")
+    ap.add_argument("--apply-delta", default="", help="Update an outfits-with-images --outfits-in from this delta")
     args = ap.parse_args()
 
+    if bool(args.item_images) == bool(args.apply_delta):
+        raise SystemExit("Pass exactly one of --item-images or --apply-delta")
+
     outfits_in = Path(args.outfits_in).expanduser().resolve()
-    item_images = Path(args.item_images).expanduser().resolve()
     images_root = Path(args.images_root).expanduser().resolve()
     outfits_out = Path(args.outfits_out).expanduser().resolve()
     outfits_out.parent.mkdir(parents=True, exist_ok=True)
@@ -57,36 +247,41 @@ def main() -> int:
     if not images_root.exists():
         raise SystemExit(f"Not found: {images_root}")
 
-    mapping = _load_item_map(item_images)
+    root_prefix = str(images_root) + os.sep
+    if outfits_in == outfits_out:
+        raise SystemExit("--outfits-out must differ from --outfits-in")
 
-    total_outfits = 0
-    total_items = 0
-    resolved = 0
+    if args.apply_delta:
+        delta = _load_delta(Path(args.apply_delta).expanduser().resolve())
+        with ManifestWriter(outfits_out, PolyvoreOutfit, args.columnar) as fout:
+            total_outfits, total_items, resolved = _apply_delta(
+                iter_records(outfits_in, PolyvoreOutfit, with_raw=True), delta, root_prefix, fout.write
+            )
+        print(f"Delta entries: {len(delta)}")
+        return _report(total_outfits, total_items, resolved, outfits_out)
 
-    with outfits_in.open("r", encoding="utf-8") as fin, outfits_out.open("w", encoding="utf-8") as fout:
-        for line in fin:
-            line = line.strip()
-            if not line:
-                continue
-            o = json.loads(line)
-            items = o.get("items") or []
-            for it in items:
-                total_items += 1
-                uid = it.get("item_uid")
-                rel = mapping.get(uid)
-                if rel:
-                    it["local_image_relpath"] = rel
-                    it["local_image_abspath"] = str((images_root / rel).resolve())
-                    resolved += 1
-            total_outfits += 1
-            fout.write(json.dumps(o, ensure_ascii=False) + "\n")
+    item_images = Path(args.item_images).expanduser().resolve()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    join = "sqlite" if workers > 1 else args.join
+    db_path = Path(args.join_db).expanduser().resolve() if args.join_db else item_images.with_suffix(".sqlite")
 
-    pct = (resolved / total_items * 100.0) if total_items else 0.0
-    print(f"Outfits: {total_outfits}")
-    print(f"Items: {total_items}")
-    print(f"Resolved images: {resolved} ({pct:.1f}%)")
-    print(f"Wrote: {outfits_out}")
-    return 0
+    if join == "sqlite":
+        _ensure_join_db(item_images, db_path)
+
+    if workers > 1:
+        total_outfits, total_items, resolved = _run_parallel(outfits_in, outfits_out, db_path, root_prefix, workers)
+        if args.columnar:
+            with ColumnarWriter(columnar_path(outfits_out, args.columnar), PolyvoreOutfit) as col:
+                for o in iter_records(outfits_out, PolyvoreOutfit):
+                    col.write(to_dict(o))
+    else:
+        lookup = _SqliteLookup(db_path) if join == "sqlite" else _DictLookup(_load_item_map(item_images))
+        with ManifestWriter(outfits_out, PolyvoreOutfit, args.columnar) as fout:
+            total_outfits, total_items, resolved = _augment(
+                iter_records(outfits_in, PolyvoreOutfit, with_raw=True), lookup, root_prefix, fout.write
+            )
+
+    return _report(total_outfits, total_items, resolved, outfits_out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Micro-benchmark the manifest_io JSON backends on real manifests.
+
+For each installed backend (orjson, msgspec, stdlib json) this times:
+  decode   iter_jsonl over the whole file
+  encode   JsonlWriter over the decoded records (to a temp file)
+and reports records/s, MB/s and speedup over stdlib json, best of --repeat runs.
+
+Usage:
+  python3 tools/ml/bench_manifest_io.py \
+    --manifest tools/_out/manifests/polyvore_outfits_with_images.jsonl \
+    --manifest tools/_out/manifests/deep_fashion.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from manifest_io import JsonlWriter, available_backends, get_backend, iter_jsonl
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--manifest", action="append", required=True, help="JSONL manifest (repeatable)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    backends = available_backends()
+    print(f"Backends installed: {', '.join(backends)} (default: {get_backend().name})")
+
+    for m in args.manifest:
+        path = Path(m).expanduser().resolve()
+        mb = path.stat().st_size / 1e6
+        records = list(iter_jsonl(path, get_backend("json")))
+        print(f"\n{path.name}: {len(records)} records, {mb:.1f} MB")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out = Path(tmp) / "out.jsonl"
+            timings = {}
+            # stdlib first so the others can be reported relative to it.
+            for name in sorted(backends, key=lambda b: b != "json"):
+                backend = get_backend(name)
+
+                def decode():
+                    for _ in iter_jsonl(path, backend):
+                        pass
+
+                def encode():
+                    with JsonlWriter(out, backend=backend) as w:
+                        w.write_many(records)
+
+                t_dec = _best(decode, args.repeat)
+                t_enc = _best(encode, args.repeat)
+                timings[name] = (t_dec, t_enc)
+                ref_dec, ref_enc = timings.get("json", (t_dec, t_enc))
+                out_mb = os.path.getsize(out) / 1e6
+                print(
+                    f"  {name:8s} decode {len(records) / t_dec:>9.0f} rec/s {mb / t_dec:6.1f} MB/s x{ref_dec / t_dec:4.1f} | "
+                    f"encode {len(records) / t_enc:>9.0f} rec/s x{ref_enc / t_enc:4.1f} | out {out_mb:.1f} MB"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -12,8 +12,19 @@ Each item has:
   - 'category_id': int (1..13)
   - 'category_name': str
 
-This script produces COCO *detection* annotations (bbox only). Segmentation
-polygons/masks are not exported here.
+This script produces COCO *detection* annotations (bbox only) by default.
+Items also carry 'segmentation' (a list of polygons) and 'landmarks'
+([x, y, visibility] * n, n fixed per category); export them with:
+
+  --segmentation polygon   the DF2 polygons, as COCO polygon segmentation
+  --segmentation rle       polygons rasterized (vectorized NumPy) into COCO
+                           compressed RLE ({"size": [h, w], "counts": "..."})
+  --keypoints              landmarks as COCO keypoints/num_keypoints, in
+                           DF2's 294-slot layout (each category owns a range)
+
+Masks are encoded inside the worker shards, so use --workers to spread that
+cost. The "area" stays the bbox area either way, so the detection fields are
+unchanged.
 
 Usage:
   python3 tools/ml/convert_deepfashion2_to_coco.py \
@@ -22,13 +33,191 @@ Usage:
     --split train
 
 Run once per split (train/validation/test). For test, annotations may be absent.
+
+Add `--workers 0` to parse annotation files on all cores; shards are merged in
+file order so image/annotation ids are the same as a serial run.
+
+Images whose annotation lacks height/width (most of DF2) are sized by reading
+the JPEG/PNG header only, via the shared cache in tools/ml/image_size.py
+(`--size-cache`, default <out-dir>/image_sizes.json).
+
+`--incremental` keeps a per-file manifest next to the output and only re-parses
+annotation files that were added or changed since the last run; image_ids of
+existing images stay stable.
+
+`--columnar` also writes a NumPy sidecar (boxes/labels/areas plus per-image
+offsets) that train_deepfashion2_frcnn_smoke.py can memory-map via `--columnar`
+instead of parsing the JSON.
+
+`--df2-zip /path/to/train.zip` converts straight from the (encrypted) archive,
+with no extraction step. Annotations are read out of <split>/annos/ in the zip
+and image sizes come from a header probe of the entry. A persisted entry index
+(tools/ml/zip_entries.py) replaces a central-directory parse per worker, and
+each worker opens its own archive handle. The output is identical to
+converting the extracted tree. Not combinable with --incremental.
+
+The COCO JSON is streamed to disk (annotations spill to a temp file and are
+spliced in after the images), so memory stays flat regardless of split size.
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
-from pathlib import Path
+import os
+import shutil
+import tempfile
+from array import array
+from pathlib import Path, PurePosixPath
+
+from image_size import ImageSizeCache, probe_stream_size
+from zip_entries import ZipEntryIndex, zip_password
+
+# Per-process image size cache; set by _init_worker (or directly in serial mode).
+_SIZE_CACHE = ImageSizeCache()
+# Per-process archive when converting with --df2-zip (None: read the extracted tree).
+_ZIP: ZipEntryIndex | None = None
+
+
+def _init_worker(size_cache_path: str, zip_index: ZipEntryIndex | None = None) -> None:
+    global _SIZE_CACHE, _ZIP
+    _SIZE_CACHE = ImageSizeCache(Path(size_cache_path) if size_cache_path else None)
+    _ZIP = zip_index
+
+
+def _find_image(images_dir: str, stem: str) -> str | None:
+    """File name of the image for `stem` (.jpg, else .png), or None if absent."""
+    for name in (f"{stem}.jpg", f"{stem}.png"):
+        if _ZIP is not None:
+            if f"{images_dir}/{name}" in _ZIP:
+                return name
+        elif (Path(images_dir) / name).exists():
+            return name
+    return None
+
+
+def _image_size(images_dir: str, name: str) -> tuple[int, int]:
+    if _ZIP is None:
+        # Cached header-only probe (PIL only for odd formats).
+        return _SIZE_CACHE.get(Path(images_dir) / name)
+    entry = f"{images_dir}/{name}"
+    with _ZIP.open(entry) as f:
+        size = probe_stream_size(f)
+    if size is not None:
+        return size
+    import io
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(_ZIP.read(entry))) as im:
+        return im.size
+
+
+# DF2 landmark count per category. COCO keypoints use DF2's shared 294-slot
+# layout: category c owns slots _KP_OFFSET[c] .. _KP_OFFSET[c] + _KP_COUNT[c] - 1.
+_KP_COUNT = {1: 25, 2: 33, 3: 31, 4: 39, 5: 15, 6: 15, 7: 10, 8: 14, 9: 8, 10: 29, 11: 37, 12: 19, 13: 19}
+_KP_OFFSET = {c: sum(_KP_COUNT[k] for k in _KP_COUNT if k < c) for c in _KP_COUNT}
+NUM_KEYPOINTS = sum(_KP_COUNT.values())
+
+
+def _polygons(seg) -> list[list[float]]:
+    """Valid DF2 polygons (flat x,y lists with >= 3 points) as floats."""
+    if not isinstance(seg, list):
+        return []
+    out = []
+    for poly in seg:
+        if (
+            isinstance(poly, list)
+            and len(poly) >= 6
+            and len(poly) % 2 == 0
+            and all(isinstance(x, (int, float)) for x in poly)
+        ):
+            out.append([float(x) for x in poly])
+    return out
+
+
+def rasterize_polygons(polys: list[list[float]], height: int, width: int):
+    """Union of the polygons as an (height, width) bool mask.
+
+    A pixel is inside when its centre is (even-odd rule). Per polygon, all
+    scanline/edge crossings are computed in one broadcast. Each crossing bumps a
+    per-row counter at the first pixel to its right, and a cumulative sum's parity
+    fills the spans. pycocotools traces edges slightly differently, so boundary
+    pixels can differ from its frPyObjects masks.
+    """
+    import numpy as np
+
+    mask = np.zeros((height, width), dtype=bool)
+    for poly in polys:
+        pts = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+        x0, y0 = pts[:, 0], pts[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        r0 = max(0, int(np.floor(y0.min())))
+        r1 = min(height, int(np.ceil(y0.max())) + 1)
+        if r0 >= r1:
+            continue
+        yc = np.arange(r0, r1, dtype=np.float64)[:, None] + 0.5
+        lo, hi = np.minimum(y0, y1), np.maximum(y0, y1)
+        rows, edges = np.nonzero((yc >= lo) & (yc < hi))
+        if not len(rows):
+            continue
+        t = (yc[rows, 0] - y0[edges]) / (y1[edges] - y0[edges])
+        xs = x0[edges] + t * (x1[edges] - x0[edges])
+        # The crossing counts for pixel px when xs < px + 0.5.
+        cols = np.clip(np.floor(xs - 0.5).astype(np.int64) + 1, 0, width)
+        diff = np.zeros((r1 - r0, width + 1), dtype=np.int32)
+        np.add.at(diff, (rows, cols), 1)
+        mask[r0:r1] |= (np.cumsum(diff, axis=1)[:, :width] & 1).astype(bool)
+    return mask
+
+
+def rle_encode(mask) -> dict:
+    """COCO compressed RLE ({"size": [h, w], "counts": str}), as pycocotools encodes it."""
+    import numpy as np
+
+    h, w = mask.shape
+    flat = mask.T.ravel()  # column-major, like pycocotools
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], change, [flat.size]))).tolist()
+    if flat.size and flat[0]:
+        runs.insert(0, 0)
+    # LEB128-style, 5 bits per char, storing deltas vs two runs back (rleToString).
+    out = []
+    for i, x in enumerate(runs):
+        if i > 2:
+            x -= runs[i - 2]
+        more = True
+        while more:
+            c = x & 0x1F
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            out.append(chr(c + 48))
+    return {"size": [h, w], "counts": "".join(out)}
+
+
+def _keypoints(landmarks, cat_id: int) -> tuple[list, int]:
+    """(COCO keypoints in the 294-slot layout, number labelled). If the landmark
+    count does not match the category, all slots stay unlabelled."""
+    kps = [0] * (NUM_KEYPOINTS * 3)
+    n = _KP_COUNT.get(cat_id)
+    if (
+        n is None
+        or not isinstance(landmarks, list)
+        or len(landmarks) != n * 3
+        or not all(isinstance(x, (int, float)) for x in landmarks)
+    ):
+        return kps, 0
+    start = _KP_OFFSET[cat_id] * 3
+    labelled = 0
+    for i in range(0, len(landmarks), 3):
+        x, y, v = landmarks[i : i + 3]
+        if v > 0:
+            kps[start + i : start + i + 3] = [float(x), float(y), int(v)]
+            labelled += 1
+    return kps, labelled
 
 
 def _iter_annos(annos_dir: Path):
@@ -36,79 +225,67 @@ def _iter_annos(annos_dir: Path):
         yield p
 
 
-def _load_json(p: Path) -> dict:
-    with p.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-
 def _ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--df2-root", required=True)
-    ap.add_argument("--out-dir", required=True)
-    ap.add_argument("--split", required=True, choices=["train", "validation", "test"])
-    ap.add_argument("--limit", type=int, default=0, help="Optional cap on number of images")
-    args = ap.parse_args()
-
-    df2_root = Path(args.df2_root).expanduser().resolve()
-    split = args.split
-    annos_dir = df2_root / split / "annos"
-    images_dir = df2_root / split / "image"
-
-    if split == "test" and not annos_dir.exists():
-        raise SystemExit("Test annotations not present; cannot build COCO labels")
-
-    if not annos_dir.is_dir():
-        raise SystemExit(f"Missing annos dir: {annos_dir}")
-    if not images_dir.is_dir():
-        raise SystemExit(f"Missing image dir: {images_dir}")
-
-    out_dir = Path(args.out_dir).expanduser().resolve()
-    _ensure_dir(out_dir)
-
-    coco = {
-        "info": {"description": f"DeepFashion2 {split} -> COCO"},
-        "licenses": [],
-        "images": [],
-        "annotations": [],
-        "categories": [],
-    }
-
-    cat_id_to_name: dict[int, str] = {}
-    image_id = 0
-    ann_id = 0
-
-    for anno_path in _iter_annos(annos_dir):
-        anno = _load_json(anno_path)
-        img_stem = anno_path.stem
-        img_name = f"{img_stem}.jpg"
-        img_path = images_dir / img_name
-        if not img_path.exists():
-            # Some datasets might have png; try fallback.
-            alt = images_dir / f"{img_stem}.png"
-            if alt.exists():
-                img_name = alt.name
-                img_path = alt
-            else:
-                continue
+def _chunked(seq: list, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i : i + size]
+
+
+def _convert_shard(
+    anno_paths: list[str],
+    images_dir: str,
+    hash_files: bool = False,
+    segmentation: str = "none",
+    keypoints: bool = False,
+) -> dict:
+    """Convert a contiguous run of annotation files into a COCO shard.
+
+    Image and annotation ids are local to the shard (0-based, in input order);
+    the parent remaps them to global ids when merging. Categories are returned
+    as (category_id, name, local_image_id) in first-seen order so that a
+    `--limit` cut in the middle of a shard keeps names identical to a serial run.
+    "files" lists (file name, sha1 or None, local image id or -1) per input file
+    for incremental mode. Image sizes probed for this shard are returned under "sizes" for the parent
+    to merge into the persistent cache.
+
+    `segmentation` ("none", "polygon" or "rle") and `keypoints` select the optional
+    exports. Masks are rasterized and RLE-encoded here, so with --workers that cost
+    is spread over the pool.
+    """
+    images: list[dict] = []
+    annotations: list[dict] = []
+    categories: list[tuple[int, str, int]] = []
+    files: list[tuple[str, str | None, int]] = []
+
+    for anno_str in anno_paths:
+        if _ZIP is not None:
+            anno_path = PurePosixPath(anno_str)
+            raw = _ZIP.read(anno_str)
+        else:
+            anno_path = Path(anno_str)
+            raw = anno_path.read_bytes()
+        anno = json.loads(raw)
+        digest = hashlib.sha1(raw).hexdigest() if hash_files else None
+        # Some datasets might have png; _find_image falls back to it.
+        img_name = _find_image(images_dir, anno_path.stem)
+        if img_name is None:
+            files.append((anno_path.name, digest, -1))
+            continue
 
         # Image size is stored in annotation JSON for DF2.
         # But to be safe, prefer annotation fields if present.
         height = anno.get("height")
         width = anno.get("width")
         if not (isinstance(height, int) and isinstance(width, int)):
-            # Fall back to PIL if missing.
-            from PIL import Image
+            width, height = _image_size(images_dir, img_name)
 
-            with Image.open(img_path) as im:
-                width, height = im.size
-
-        coco["images"].append(
-            {"id": image_id, "file_name": img_name, "width": int(width), "height": int(height)}
-        )
+        image_id = len(images)
+        files.append((anno_path.name, digest, image_id))
+        seen_cats: set[int] = set()
+        images.append({"id": image_id, "file_name": img_name, "width": int(width), "height": int(height)})
 
         for k, v in anno.items():
             if not (isinstance(k, str) and k.startswith("item")):
@@ -127,8 +304,9 @@ def main() -> int:
                 continue
             if not isinstance(cat_id, int):
                 continue
-            if isinstance(cat_name, str):
-                cat_id_to_name.setdefault(cat_id, cat_name)
+            if isinstance(cat_name, str) and cat_id not in seen_cats:
+                seen_cats.add(cat_id)
+                categories.append((cat_id, cat_name, image_id))
 
             x1, y1, x2, y2 = bbox
             w = max(0.0, float(x2) - float(x1))
@@ -136,40 +314,532 @@ def main() -> int:
             if w <= 1.0 or h <= 1.0:
                 continue
 
-            coco["annotations"].append(
-                {
-                    "id": ann_id,
-                    "image_id": image_id,
-                    "category_id": cat_id,
-                    "bbox": [float(x1), float(y1), w, h],
-                    "area": float(w * h),
-                    "iscrowd": 0,
-                    "segmentation": [],
-                }
-            )
+            ann = {
+                "id": len(annotations),
+                "image_id": image_id,
+                "category_id": cat_id,
+                "bbox": [float(x1), float(y1), w, h],
+                "area": float(w * h),
+                "iscrowd": 0,
+                "segmentation": [],
+            }
+            if segmentation != "none":
+                polys = _polygons(v.get("segmentation"))
+                if segmentation == "rle" and polys:
+                    ann["segmentation"] = rle_encode(rasterize_polygons(polys, int(height), int(width)))
+                else:
+                    ann["segmentation"] = polys
+            if keypoints:
+                ann["keypoints"], ann["num_keypoints"] = _keypoints(v.get("landmarks"), cat_id)
+            annotations.append(ann)
+
+    return {
+        "images": images,
+        "annotations": annotations,
+        "categories": categories,
+        "files": files,
+        "sizes": _SIZE_CACHE.drain_new(),
+    }
+
+
+def _iter_shards(
+    anno_paths: list[str],
+    images_dir: Path | str,
+    workers: int,
+    chunk_size: int,
+    size_cache_path: str,
+    hash_files: bool = False,
+    zip_index: ZipEntryIndex | None = None,
+    export: tuple[str, bool] = ("none", False),
+):
+    """Yield converted shards in input order.
+
+    With workers > 1 the chunks run on a process pool. At most 2x workers chunks
+    are in flight, so memory stays bounded and a `--limit` run can stop early.
+    `export` is the (segmentation, keypoints) pair passed to _convert_shard.
+    """
+    chunks = _chunked(anno_paths, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield _convert_shard(chunk, str(images_dir), hash_files, *export)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(size_cache_path, zip_index)
+    ) as ex:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(ex.submit(_convert_shard, chunk, str(images_dir), hash_files, *export))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _ColumnarWriter:
+    """Collect boxes/labels/areas into flat arrays for a memory-mappable sidecar.
+
+    Layout of <out-dir>/instances_<split>_columnar/ (one .npy per column):
+      image_ids, widths, heights, file_names   (N,)  one row per image
+      ann_offsets                              (N+1,) annotations of image i are
+                                               rows ann_offsets[i]:ann_offsets[i+1]
+      boxes (M, 4) float32 COCO xywh, category_ids (M,) int32, areas (M,) float32
+      categories                               (K,) sorted DF2 category ids
+
+    Rows are buffered in compact `array` buffers; NumPy is only needed at finish.
+    Images and annotations must each arrive in ascending image_id order (as both
+    the full and incremental paths emit them); offsets are derived from that.
+    """
+
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        self._image_ids = array("q")
+        self._widths = array("i")
+        self._heights = array("i")
+        self._file_names: list[bytes] = []
+        self._ann_image_ids = array("q")
+        self._boxes = array("f")
+        self._category_ids = array("i")
+        self._areas = array("f")
+
+    def add_image(self, im: dict) -> None:
+        self._image_ids.append(im["id"])
+        self._widths.append(im["width"])
+        self._heights.append(im["height"])
+        self._file_names.append(im["file_name"].encode("utf-8"))
+
+    def add_annotation(self, a: dict) -> None:
+        self._ann_image_ids.append(a["image_id"])
+        self._boxes.extend(a["bbox"])
+        self._category_ids.append(a["category_id"])
+        self._areas.append(a["area"])
+
+    def finish(self, categories: list[dict]) -> None:
+        import numpy as np
+
+        image_ids = np.frombuffer(self._image_ids, dtype=np.int64)
+        ann_image_ids = np.frombuffer(self._ann_image_ids, dtype=np.int64)
+        offsets = np.empty(len(image_ids) + 1, dtype=np.int64)
+        offsets[:-1] = np.searchsorted(ann_image_ids, image_ids, side="left")
+        offsets[-1] = len(ann_image_ids)
+        max_name = max((len(n) for n in self._file_names), default=1)
+        cols = {
+            "image_ids": image_ids,
+            "widths": np.frombuffer(self._widths, dtype=np.int32),
+            "heights": np.frombuffer(self._heights, dtype=np.int32),
+            "file_names": np.array(self._file_names, dtype=f"S{max_name}"),
+            "ann_offsets": offsets,
+            "boxes": np.frombuffer(self._boxes, dtype=np.float32).reshape(-1, 4),
+            "category_ids": np.frombuffer(self._category_ids, dtype=np.int32),
+            "areas": np.frombuffer(self._areas, dtype=np.float32),
+            "categories": np.array([c["id"] for c in categories], dtype=np.int32),
+        }
+        _ensure_dir(self.out_dir)
+        for name, arr in cols.items():
+            np.save(self.out_dir / f"{name}.npy", arr)
+
+
+class _CocoStreamWriter:
+    """Write a COCO JSON file incrementally with flat memory.
+
+    Images are written straight into the output; annotations are spilled to a
+    temp file next to it and spliced in after the images array. The result is
+    byte-identical to `json.dump(coco, f)` on the equivalent in-memory dict.
+    The output is written under a temp name and renamed into place on finish.
+    """
+
+    def __init__(self, out_path: Path, info: dict, sidecar: _ColumnarWriter | None = None):
+        self.out_path = out_path
+        self.sidecar = sidecar
+        self._tmp_path = out_path.with_name(out_path.name + ".tmp")
+        self._f = self._tmp_path.open("w", encoding="utf-8")
+        self._spill = tempfile.TemporaryFile("w+", encoding="utf-8", dir=out_path.parent)
+        self.num_images = 0
+        self.num_annotations = 0
+        self._f.write('{"info": ' + json.dumps(info) + ', "licenses": [], "images": [')
+
+    def add_image(self, im: dict) -> None:
+        if self.num_images:
+            self._f.write(", ")
+        self._f.write(json.dumps(im))
+        self.num_images += 1
+        if self.sidecar is not None:
+            self.sidecar.add_image(im)
+
+    def add_annotation(self, a: dict) -> None:
+        if self.num_annotations:
+            self._spill.write(", ")
+        self._spill.write(json.dumps(a))
+        self.num_annotations += 1
+        if self.sidecar is not None:
+            self.sidecar.add_annotation(a)
+
+    def finish(self, categories: list[dict]) -> None:
+        self._f.write('], "annotations": [')
+        self._spill.seek(0)
+        shutil.copyfileobj(self._spill, self._f, 1024 * 1024)
+        self._spill.close()
+        self._f.write('], "categories": ' + json.dumps(categories) + "}")
+        self._f.close()
+        os.replace(self._tmp_path, self.out_path)
+        if self.sidecar is not None:
+            self.sidecar.finish(categories)
+
+    def abort(self) -> None:
+        self._spill.close()
+        self._f.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def _convert_full(
+    writer: _CocoStreamWriter,
+    anno_paths: list[str],
+    images_dir: Path | str,
+    workers: int,
+    chunk_size: int,
+    size_cache_path: str,
+    limit: int,
+    cat_id_to_name: dict[int, str],
+    export: tuple[str, bool] = ("none", False),
+) -> None:
+    image_id = 0
+    ann_id = 0
+    for shard in _iter_shards(
+        anno_paths, images_dir, workers, chunk_size, size_cache_path, zip_index=_ZIP, export=export
+    ):
+        _SIZE_CACHE.update(shard["sizes"])
+        # Remap shard-local ids onto the global sequence; shards arrive in file order,
+        # so ids match a serial run exactly.
+        keep = len(shard["images"])
+        if limit:
+            keep = min(keep, limit - image_id)
+
+        for cid, name, local_img in shard["categories"]:
+            if local_img < keep:
+                cat_id_to_name.setdefault(cid, name)
+
+        for im in shard["images"][:keep]:
+            im["id"] += image_id
+            writer.add_image(im)
+
+        for a in shard["annotations"]:
+            if a["image_id"] >= keep:
+                break
+            a["id"] = ann_id
+            a["image_id"] += image_id
+            writer.add_annotation(a)
             ann_id += 1
 
-        image_id += 1
-        if args.limit and image_id >= args.limit:
+        image_id += keep
+        if limit and image_id >= limit:
             break
 
-    # COCO categories: ids should be contiguous in many trainers, but we keep DF2 ids.
-    for cid in sorted(cat_id_to_name.keys()):
-        coco["categories"].append({"id": cid, "name": cat_id_to_name[cid], "supercategory": "clothing"})
+
+_MANIFEST_VERSION = 1
+
+
+def _sha1_file(p: Path) -> str:
+    return hashlib.sha1(p.read_bytes()).hexdigest()
+
+
+def _export_key(export: tuple[str, bool]) -> dict:
+    return {"segmentation": export[0], "keypoints": export[1]}
+
+
+def _load_manifest(path: Path, export: tuple[str, bool] = ("none", False)) -> tuple[dict[str, dict], int]:
+    """Return (file name -> entry, next_image_id); empty if missing, outdated, or
+    written with different segmentation/keypoint options."""
+    if not path.exists():
+        return {}, 0
+    entries: dict[str, dict] = {}
+    with path.open("r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("version") != _MANIFEST_VERSION:
+            return {}, 0
+        if header.get("export", _export_key(("none", False))) != _export_key(export):
+            return {}, 0
+        for line in f:
+            e = json.loads(line)
+            entries[e["file"]] = e
+    return entries, int(header.get("next_image_id", 0))
+
+
+def _save_manifest(
+    path: Path, entries: list[dict], next_image_id: int, export: tuple[str, bool] = ("none", False)
+) -> None:
+    header = {"version": _MANIFEST_VERSION, "next_image_id": next_image_id}
+    if export != ("none", False):
+        header["export"] = _export_key(export)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for e in entries:
+            f.write(json.dumps(e) + "\n")
+    os.replace(tmp, path)
+
+
+def _convert_incremental(
+    writer: _CocoStreamWriter,
+    annos_dir: Path,
+    images_dir: Path,
+    manifest_path: Path,
+    workers: int,
+    chunk_size: int,
+    size_cache_path: str,
+    cat_id_to_name: dict[int, str],
+    export: tuple[str, bool] = ("none", False),
+) -> tuple[int, int, int]:
+    """Re-parse only new/changed annotation files and rewrite the output.
+
+    The manifest keeps, per annotation file, its (size, mtime_ns, sha1) and the
+    image/annotation records it produced. Unchanged files reuse those records;
+    a file whose mtime moved but whose content hash did not is also reused.
+    image_ids are stable across runs: changed files keep their id, new files
+    get fresh ids past the highest ever assigned, deleted files drop out.
+    Annotation ids are renumbered on every write. A first run (no manifest)
+    produces the same output as a full conversion. Changing the segmentation/keypoint
+    options discards the manifest, since its stored annotations no longer match.
+
+    Returns (reused, reparsed, deleted) file counts.
+    """
+    old, next_image_id = _load_manifest(manifest_path, export)
+
+    current: dict[str, os.stat_result] = {}
+    with os.scandir(annos_dir) as it:
+        for de in it:
+            if de.name.endswith(".json") and de.is_file():
+                current[de.name] = de.stat()
+
+    entries: dict[str, dict] = {}
+    changed: list[str] = []
+    for name in sorted(current):
+        st = current[name]
+        e = old.get(name)
+        # Entries without an image are re-parsed: their image may have appeared since.
+        if e is not None and e["image_id"] is not None and e["size"] == st.st_size:
+            if e["mtime_ns"] == st.st_mtime_ns:
+                entries[name] = e
+                continue
+            if _sha1_file(annos_dir / name) == e["sha1"]:
+                e["mtime_ns"] = st.st_mtime_ns
+                entries[name] = e
+                continue
+        changed.append(str(annos_dir / name))
+    reused = len(entries)
+    deleted = len(old.keys() - current.keys())
+
+    for shard in _iter_shards(
+        changed, images_dir, workers, chunk_size, size_cache_path, hash_files=True, export=export
+    ):
+        _SIZE_CACHE.update(shard["sizes"])
+        anns_by_img: dict[int, list[dict]] = {}
+        for a in shard["annotations"]:
+            local_img = a.pop("image_id")
+            del a["id"]
+            anns_by_img.setdefault(local_img, []).append(a)
+        cats_by_img: dict[int, list[list]] = {}
+        for cid, cname, local_img in shard["categories"]:
+            cats_by_img.setdefault(local_img, []).append([cid, cname])
+
+        for name, digest, local_img in shard["files"]:
+            st = current[name]
+            prev = old.get(name)
+            e = {"file": name, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": digest}
+            if local_img < 0:
+                e.update({"image_id": None, "image": None, "annotations": [], "categories": []})
+            else:
+                if prev is not None and prev["image_id"] is not None:
+                    img_id = prev["image_id"]
+                else:
+                    img_id = next_image_id
+                    next_image_id += 1
+                image = dict(shard["images"][local_img])
+                del image["id"]
+                e.update(
+                    {
+                        "image_id": img_id,
+                        "image": image,
+                        "annotations": anns_by_img.get(local_img, []),
+                        "categories": cats_by_img.get(local_img, []),
+                    }
+                )
+            entries[name] = e
+
+    ordered = sorted((e for e in entries.values() if e["image_id"] is not None), key=lambda e: e["image_id"])
+    ann_id = 0
+    for e in ordered:
+        img_id = e["image_id"]
+        for cid, cname in e["categories"]:
+            cat_id_to_name.setdefault(cid, cname)
+        writer.add_image({"id": img_id, **e["image"]})
+        for a in e["annotations"]:
+            writer.add_annotation({"id": ann_id, "image_id": img_id, **a})
+            ann_id += 1
+
+    _save_manifest(manifest_path, [entries[name] for name in sorted(entries)], next_image_id, export)
+    return reused, len(changed), deleted
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--df2-root", help="Extracted DeepFashion2 tree")
+    src.add_argument("--df2-zip", help="Convert straight from this archive (e.g. train.zip); no extraction")
+    ap.add_argument("--password", default="", help="--df2-zip password (default: $DEEPFASHION2_ZIP_PASSWORD or prompt)")
+    ap.add_argument("--zip-index", default="", help="--df2-zip entry index dir (default: <zip>.entries next to it)")
+    ap.add_argument("--out-dir", required=True)
+    ap.add_argument("--split", required=True, choices=["train", "validation", "test"])
+    ap.add_argument("--limit", type=int, default=0, help="Optional cap on number of images")
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parse annotation files on N processes (0 = all cores). Output is identical to a serial run.",
+    )
+    ap.add_argument("--chunk-size", type=int, default=1000, help="Annotation files per worker shard")
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-parse annotation files changed since the last run (keeps image_ids stable)",
+    )
+    ap.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Also write a memory-mappable NumPy sidecar (<out-dir>/instances_<split>_columnar/)",
+    )
+    ap.add_argument(
+        "--segmentation",
+        choices=["none", "polygon", "rle"],
+        default="none",
+        help="Export DF2 masks: polygons as-is, or rasterized to COCO compressed RLE (default: none)",
+    )
+    ap.add_argument(
+        "--keypoints",
+        action="store_true",
+        help="Export DF2 landmarks as COCO keypoints (DF2's 294-slot layout)",
+    )
+    ap.add_argument(
+        "--size-cache",
+        default="",
+        help="Image size cache JSON (default: <out-dir>/image_sizes.json; 'none' to disable)",
+    )
+    args = ap.parse_args()
+
+    global _SIZE_CACHE, _ZIP
+    split = args.split
+    if args.df2_zip:
+        if args.incremental:
+            raise SystemExit("--incremental works on an extracted tree; drop it with --df2-zip")
+        zip_path = Path(args.df2_zip).expanduser().resolve()
+        if not zip_path.is_file():
+            raise SystemExit(f"Not found: {zip_path}")
+        zip_index = Path(args.zip_index).expanduser().resolve() if args.zip_index else None
+        _ZIP = ZipEntryIndex(zip_path, zip_password(args.password), zip_index)
+        anno_paths = _ZIP.names(f"{split}/annos/", ".json")
+        images_dir = f"{split}/image"
+        if not anno_paths:
+            if split == "test":
+                raise SystemExit("Test annotations not present; cannot build COCO labels")
+            raise SystemExit(f"No {split}/annos/*.json entries in {zip_path}")
+        if not _ZIP.names(images_dir + "/"):
+            raise SystemExit(f"No {images_dir}/ entries in {zip_path}")
+    else:
+        df2_root = Path(args.df2_root).expanduser().resolve()
+        annos_dir = df2_root / split / "annos"
+        images_dir = df2_root / split / "image"
+
+        if split == "test" and not annos_dir.exists():
+            raise SystemExit("Test annotations not present; cannot build COCO labels")
+
+        if not annos_dir.is_dir():
+            raise SystemExit(f"Missing annos dir: {annos_dir}")
+        if not images_dir.is_dir():
+            raise SystemExit(f"Missing image dir: {images_dir}")
+
+    if args.incremental and args.limit:
+        raise SystemExit("--incremental cannot be combined with --limit")
+
+    out_dir = Path(args.out_dir).expanduser().resolve()
+    _ensure_dir(out_dir)
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    chunk_size = max(1, args.chunk_size)
+
+    if args.size_cache == "none":
+        size_cache_path = ""
+    elif args.size_cache:
+        size_cache_path = str(Path(args.size_cache).expanduser().resolve())
+    else:
+        size_cache_path = str(out_dir / "image_sizes.json")
+    _SIZE_CACHE = ImageSizeCache(Path(size_cache_path) if size_cache_path else None)
+
+    cat_id_to_name: dict[int, str] = {}
+    export = (args.segmentation, args.keypoints)
 
     out_json = out_dir / f"instances_{split}.json"
     out_classes = out_dir / "classes.txt"
+    out_columnar = out_dir / f"instances_{split}_columnar"
+    sidecar = _ColumnarWriter(out_columnar) if args.columnar else None
+    writer = _CocoStreamWriter(out_json, {"description": f"DeepFashion2 {split} -> COCO"}, sidecar)
+
+    try:
+        if args.incremental:
+            manifest_path = out_dir / f"instances_{split}.manifest.jsonl"
+            reused, reparsed, deleted = _convert_incremental(
+                writer,
+                annos_dir,
+                images_dir,
+                manifest_path,
+                workers,
+                chunk_size,
+                size_cache_path,
+                cat_id_to_name,
+                export,
+            )
+            print(f"Incremental: reused={reused} reparsed={reparsed} deleted={deleted}")
+            print(f"Wrote: {manifest_path}")
+        else:
+            if _ZIP is None:
+                anno_paths = [str(p) for p in _iter_annos(annos_dir)]
+            _convert_full(
+                writer,
+                anno_paths,
+                images_dir,
+                workers,
+                chunk_size,
+                size_cache_path,
+                args.limit,
+                cat_id_to_name,
+                export,
+            )
+    except BaseException:
+        writer.abort()
+        raise
 
-    with out_json.open("w", encoding="utf-8") as f:
-        json.dump(coco, f)
+    # COCO categories: ids should be contiguous in many trainers, but we keep DF2 ids.
+    categories = [
+        {"id": cid, "name": cat_id_to_name[cid], "supercategory": "clothing"} for cid in sorted(cat_id_to_name.keys())
+    ]
+    if args.keypoints:
+        # Every category shares the 294 slot names; only its own range is ever labelled.
+        for c in categories:
+            c["keypoints"] = [str(i) for i in range(1, NUM_KEYPOINTS + 1)]
+            c["skeleton"] = []
+    writer.finish(categories)
+    _SIZE_CACHE.save()
 
     with out_classes.open("w", encoding="utf-8") as f:
         for cid in sorted(cat_id_to_name.keys()):
             f.write(f"{cid}\t{cat_id_to_name[cid]}\n")
 
     print(f"Wrote: {out_json}")
-    print(f"Images: {len(coco['images'])}  Annotations: {len(coco['annotations'])}  Categories: {len(coco['categories'])}")
+    print(f"Images: {writer.num_images}  Annotations: {writer.num_annotations}  Categories: {len(categories)}")
     print(f"Wrote: {out_classes}")
+    if sidecar is not None:
+        print(f"Wrote: {out_columnar}")
     return 0
 
 
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Shared DataLoader setup and throughput reporting for the smoke trainers.
+
+All trainers expose the same loader flags (see `add_loader_args`):
+  --num-workers N          decode/transform on N worker processes (0 = main thread)
+  --pin-memory auto|on|off page-locked host batches (auto: only on CUDA)
+  --persistent-workers     keep workers alive across epochs
+  --prefetch-factor N      batches each worker prepares ahead
+  --bench-loader N         only iterate N batches without a model and report decode img/s
+
+Datasets passed to `make_loader` must be worker-safe: module-level classes that
+hold plain data (paths, ints, small arrays) and build anything heavy (transforms,
+memory maps, file handles) themselves, so they pickle cleanly under the macOS
+'spawn' start method. No closures over trainer locals.
+
+Usage (from a trainer):
+  from data_loading import ThroughputMeter, add_loader_args, bench_loader, make_loader
+
+  add_loader_args(ap)
+  ...
+  dl = make_loader(ds, args, device=device, batch_size=16, shuffle=True)
+  if args.bench_loader:
+      return bench_loader(dl, args.bench_loader)
+  meter = ThroughputMeter()
+  for xb, yb in meter.wrap(dl):
+      ...
+      meter.step(len(xb))
+  print(meter.summary())
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+
+def add_loader_args(ap: argparse.ArgumentParser, default_workers: int = 0) -> None:
+    g = ap.add_argument_group("data loading")
+    g.add_argument("--num-workers", type=int, default=default_workers, help="DataLoader worker processes")
+    g.add_argument("--pin-memory", choices=["auto", "on", "off"], default="auto")
+    g.add_argument("--persistent-workers", action="store_true", help="Keep workers alive between epochs")
+    g.add_argument("--prefetch-factor", type=int, default=2, help="Batches prefetched per worker")
+    g.add_argument(
+        "--bench-loader",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Iterate N batches without training and report loader throughput, then exit",
+    )
+
+
+def make_loader(dataset, args: argparse.Namespace, *, device: str, batch_size: int, shuffle: bool, collate_fn=None):
+    import torch
+
+    if args.pin_memory == "auto":
+        pin = device == "cuda"
+    else:
+        pin = args.pin_memory == "on"
+
+    kwargs = {
+        "batch_size": batch_size,
+        "shuffle": shuffle,
+        "num_workers": max(0, args.num_workers),
+        "pin_memory": pin,
+        "collate_fn": collate_fn,
+    }
+    # These options are rejected by DataLoader when running on the main thread.
+    if kwargs["num_workers"] > 0:
+        kwargs["persistent_workers"] = args.persistent_workers
+        kwargs["prefetch_factor"] = max(1, args.prefetch_factor)
+    return torch.utils.data.DataLoader(dataset, **kwargs)
+
+
+def imagenet_transform(size: int = 224):
+    """Resize + ToTensor + ImageNet normalisation used by the embedding trainers."""
+    from torchvision import transforms
+
+    return transforms.Compose(
+        [
+            transforms.Resize((size, size)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ]
+    )
+
+
+def _batch_size(batch) -> int:
+    first = batch[0] if isinstance(batch, (list, tuple)) else batch
+    if isinstance(first, (list, tuple)):
+        return len(first)
+    return int(first.shape[0])
+
+
+class ThroughputMeter:
+    """Split wall time into waiting on the loader vs. running the train step.
+
+    `wrap()` times each `next()` on the loader; `step(n)` closes the step that
+    started when that batch arrived. A high data-wait share means the model is
+    starved and more workers (or a cache) will help.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.steps = 0
+        self.data_s = 0.0
+        self.step_s = 0.0
+        self._t_batch: float | None = None
+
+    def wrap(self, loader):
+        it = iter(loader)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                batch = next(it)
+            except StopIteration:
+                return
+            self._t_batch = time.perf_counter()
+            self.data_s += self._t_batch - t0
+            yield batch
+
+    def step(self, num_images: int) -> None:
+        if self._t_batch is not None:
+            self.step_s += time.perf_counter() - self._t_batch
+            self._t_batch = None
+        self.images += num_images
+        self.steps += 1
+
+    def summary(self) -> str:
+        total = self.data_s + self.step_s
+        wait_pct = (self.data_s / total * 100.0) if total else 0.0
+        overall = self.images / total if total else 0.0
+        step_rate = self.images / self.step_s if self.step_s else 0.0
+        return (
+            f"throughput: images={self.images} steps={self.steps} "
+            f"data_wait={self.data_s:.1f}s ({wait_pct:.0f}%) step={self.step_s:.1f}s | "
+            f"end-to-end={overall:.1f} img/s step-only={step_rate:.1f} img/s"
+        )
+
+
+def bench_loader(loader, batches: int, images_per_sample: int = 1) -> int:
+    """Pull `batches` batches with no model attached and report decode throughput."""
+    images = 0
+    seen = 0
+    t0 = time.perf_counter()
+    # Keep pulling across epochs until we have enough batches.
+    while seen < batches:
+        progressed = False
+        for batch in loader:
+            progressed = True
+            images += _batch_size(batch) * images_per_sample
+            seen += 1
+            if seen >= batches:
+                break
+        if not progressed:
+            break
+    elapsed = time.perf_counter() - t0
+    rate = images / elapsed if elapsed else 0.0
+    workers = getattr(loader, "num_workers", 0)
+    print(f"loader bench: workers={workers} batches={seen} images={images} time={elapsed:.1f}s decode={rate:.1f} img/s")
+    return 0
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Vectorized Polyvore outfit-compatibility AUC evaluation.
+
+Parses a compatibility label file (see tools/ml/polyvore_compat.py for the two
+supported formats) and an embedding dir in FeatureStore layout. Outfits are
+padded into one (N, L) row matrix and scored in chunks. An outfit's score is the
+mean compatibility over all item pairs within it, computed with batched matrix
+ops:
+  cosine  mean pairwise cosine similarity (works for any feature dir)
+  head    mean pair-head probability (needs head.pt from --export-embeddings)
+
+Items missing from the store are dropped from their outfit; outfits left with
+fewer than two items are skipped and reported.
+
+Usage:
+  python3 tools/ml/eval_compat.py \
+    --compat Datasets/polyvore/fashion_compatibility_prediction.txt \
+    --features tools/_out/embeddings/pairwise_proj
+
+  # Polyvore Outfits (vasileva) format: resolve tokens through the split JSON
+  python3 tools/ml/eval_compat.py \
+    --compat Datasets/polyvore_outfits/disjoint/compatibility_test.txt \
+    --outfits-json Datasets/polyvore_outfits/disjoint/test.json \
+    --features tools/_out/embeddings/item_id_features
+
+Requires: numpy (+ torch for --scorer head)
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from eval_fitb import _load_head
+from extract_features import FeatureStore
+from polyvore_compat import CompatOutfits, load_outfit_item_ids, parse_compat_file
+
+
+def padded_rows(compat: CompatOutfits, store: FeatureStore):
+    """(N, L) int64 store rows per outfit, -1 for padding and items missing from the store."""
+    import numpy as np
+
+    offsets = np.frombuffer(compat.offsets, dtype=np.int64)
+    items = np.frombuffer(compat.items, dtype=np.int32)
+    key_rows = store.rows_for(compat.keys)
+    lengths = np.diff(offsets)
+    out = np.full((len(lengths), int(lengths.max(initial=0))), -1, dtype=np.int64)
+    outfit = np.repeat(np.arange(len(lengths)), lengths)
+    pos = np.arange(len(items)) - offsets[:-1][outfit]
+    out[outfit, pos] = key_rows[items]
+    return out
+
+
+def roc_auc(scores, labels) -> float:
+    """Mann-Whitney AUC with average ranks for tied scores."""
+    import numpy as np
+
+    labels = np.asarray(labels, dtype=bool)
+    n_pos = int(labels.sum())
+    n_neg = len(labels) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float("nan")
+    _, inv, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    avg_rank = np.cumsum(counts) - (counts - 1) / 2.0
+    ranks = avg_rank[inv]
+    return float((ranks[labels].sum() - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg))
+
+
+def _cosine_scores(emb, rows):
+    """(N,) mean pairwise cosine similarity over the valid items of each outfit."""
+    import numpy as np
+
+    valid = rows >= 0
+    e = emb[np.where(valid, rows, 0)]  # (N, L, D)
+    sims = np.einsum("nld,nmd->nlm", e, e)
+    l = rows.shape[1]
+    pair = valid[:, :, None] & valid[:, None, :] & np.triu(np.ones((l, l), dtype=bool), k=1)
+    return (sims * pair).sum(axis=(1, 2)) / pair.sum(axis=(1, 2))
+
+
+def _head_scores(head, emb, rows):
+    """(N,) mean pair-head probability over the valid item pairs of each outfit."""
+    import numpy as np
+    import torch
+
+    n, l = rows.shape
+    ii, jj = np.triu_indices(l, k=1)
+    valid = rows >= 0
+    pair = torch.from_numpy(valid[:, ii] & valid[:, jj])
+    e = torch.from_numpy(emb)[torch.from_numpy(np.where(valid, rows, 0))]  # (N, L, D)
+    x = torch.cat([e[:, ii], e[:, jj]], dim=2)  # (N, P, 2D)
+    with torch.inference_mode():
+        probs = torch.sigmoid(head(x.reshape(n * len(ii), -1))).reshape(n, len(ii))
+    probs = probs.masked_fill(~pair, 0.0)
+    return (probs.sum(dim=1) / pair.sum(dim=1)).numpy()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--compat", required=True, help="Compatibility label txt")
+    ap.add_argument(
+        "--outfits-json",
+        action="append",
+        default=[],
+        help="Polyvore Outfits split JSON to resolve vasileva-format tokens (repeatable)",
+    )
+    ap.add_argument("--key-prefix", default="polyvore:", help="Prefix added to parsed item keys")
+    ap.add_argument("--features", required=True, help="Embedding dir in FeatureStore layout")
+    ap.add_argument("--scorer", choices=["cosine", "head"], default="cosine")
+    ap.add_argument("--chunk", type=int, default=2048, help="Outfits scored per batch")
+    args = ap.parse_args()
+
+    import numpy as np
+
+    store_dir = Path(args.features).expanduser().resolve()
+    store = FeatureStore(store_dir)
+
+    t0 = time.perf_counter()
+    item_ids = None
+    if args.outfits_json:
+        item_ids = load_outfit_item_ids([Path(p).expanduser().resolve() for p in args.outfits_json])
+    compat = parse_compat_file(Path(args.compat).expanduser().resolve(), item_ids, args.key_prefix)
+    rows = padded_rows(compat, store)
+    labels = np.frombuffer(compat.labels, dtype=np.int8).astype(bool)
+
+    keep = (rows >= 0).sum(axis=1) >= 2
+    rows, labels = rows[keep], labels[keep]
+    skipped = int((~keep).sum()) + compat.unresolved
+    if not len(rows):
+        raise SystemExit(f"No outfits with two or more items resolved against {store_dir} (skipped {skipped})")
+
+    # Gather only the referenced rows, once, into a compact float32 matrix.
+    used = np.unique(rows[rows >= 0])
+    local = np.full(int(used.max()) + 1, -1, dtype=np.int64)
+    local[used] = np.arange(len(used))
+    rows = np.where(rows >= 0, local[np.maximum(rows, 0)], -1)
+    emb = np.asarray(store.matrix()[used], dtype=np.float32)
+    t_load = time.perf_counter() - t0
+
+    if args.scorer == "cosine":
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+        def score(r):
+            return _cosine_scores(emb, r)
+    else:
+        head = _load_head(store_dir, store.dim)
+
+        def score(r):
+            return _head_scores(head, emb, r)
+
+    t1 = time.perf_counter()
+    scores = np.concatenate([score(rows[s : s + args.chunk]) for s in range(0, len(rows), args.chunk)])
+    t_score = time.perf_counter() - t1
+
+    n = len(rows)
+    print(f"Compatibility AUC: {roc_auc(scores, labels):.4f}  scorer={args.scorer}")
+    print(f"Outfits: evaluated={n} (pos={int(labels.sum())} neg={n - int(labels.sum())}) skipped={skipped}")
+    print(f"Time: parse+resolve={t_load:.2f}s score={t_score:.2f}s ({n / t_score if t_score else 0.0:.0f} outfits/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
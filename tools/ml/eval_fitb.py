@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Vectorized Polyvore fill-in-the-blank (FITB) evaluation.
+
+Reads polyvore_fitb.jsonl (from ingest_polyvore.py) and an embedding dir in
+FeatureStore layout (tools/ml/extract_features.py, or the pairwise trainer's
+`--export-embeddings`). Every question's context items and candidate answers
+are resolved to row indices once; questions are then scored in chunks with
+batched matrix ops. There is no per-pair Python loop.
+
+A candidate's score is its mean compatibility with the question's context items:
+  cosine  cosine similarity of the embeddings (works for any feature dir)
+  head    sigmoid of the trained pair head (needs head.pt next to the
+          embeddings, written by --export-embeddings)
+
+Candidate order is shuffled with a fixed seed before scoring, so that ties
+(e.g. from an untrained model) do not favour the answer listed first.
+
+Usage:
+  python3 tools/ml/eval_fitb.py \
+    --fitb tools/_out/manifests/polyvore_fitb.jsonl \
+    --features tools/_out/embeddings/pairwise_proj \
+    --scorer head
+
+Requires: numpy (+ torch for --scorer head)
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from extract_features import FeatureStore
+from records import FitbQuestion, iter_records
+
+
+def _uid(item_id: str) -> str:
+    # ingest_polyvore.py writes items as "polyvore:<set_id>_<index>"; FITB ids omit the prefix.
+    return item_id if item_id.startswith("polyvore:") else f"polyvore:{item_id}"
+
+
+def load_questions(fitb_path: Path, store: FeatureStore, seed: int = 1337):
+    """Resolve questions to padded row matrices.
+
+    Returns (context (Q, L) int64, candidates (Q, C) int64, target (Q,) int64,
+    skipped). Padding is -1. Questions with an unresolved candidate or no
+    resolved context item are skipped.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    contexts: list[list[int]] = []
+    candidates: list[list[int]] = []
+    targets: list[int] = []
+    skipped = 0
+    for q in iter_records(fitb_path, FitbQuestion):
+        answers = q.answers
+        correct = q.correct_answer
+        ctx = [store.rows[u] for u in map(_uid, q.question_id) if u in store.rows]
+        cand = [store.rows.get(_uid(a), -1) for a in answers]
+        if not ctx or not cand or -1 in cand or correct not in answers:
+            skipped += 1
+            continue
+        order = rng.permutation(len(cand))
+        contexts.append(ctx)
+        candidates.append([cand[i] for i in order])
+        targets.append(int(np.flatnonzero(order == answers.index(correct))[0]))
+
+    def _pad(rows: list[list[int]]):
+        out = np.full((len(rows), max((len(r) for r in rows), default=0)), -1, dtype=np.int64)
+        for i, r in enumerate(rows):
+            out[i, : len(r)] = r
+        return out
+
+    return _pad(contexts), _pad(candidates), np.asarray(targets, dtype=np.int64), skipped
+
+
+def _cosine_scores(emb, ctx, cand):
+    """(Q, C) mean cosine similarity of each candidate to the valid context items."""
+    import numpy as np
+
+    mask = ctx >= 0
+    e_ctx = emb[np.where(mask, ctx, 0)]  # (Q, L, D)
+    e_cand = emb[np.where(cand >= 0, cand, 0)]  # (Q, C, D)
+    sims = np.einsum("qcd,qld->qcl", e_cand, e_ctx)
+    sims = np.where(mask[:, None, :], sims, 0.0)
+    out = sims.sum(axis=2) / mask.sum(axis=1, keepdims=True)
+    return np.where(cand >= 0, out, -np.inf)
+
+
+def _head_scores(head, emb, ctx, cand):
+    """(Q, C) mean pair-head probability of each candidate with the valid context items."""
+    import numpy as np
+    import torch
+
+    q, c = cand.shape
+    l = ctx.shape[1]
+    mask = torch.from_numpy(ctx >= 0)
+    e = torch.from_numpy(emb)
+    e_ctx = e[torch.from_numpy(np.where(ctx >= 0, ctx, 0))]  # (Q, L, D)
+    e_cand = e[torch.from_numpy(np.where(cand >= 0, cand, 0))]  # (Q, C, D)
+    pairs = torch.cat([e_cand[:, :, None, :].expand(q, c, l, -1), e_ctx[:, None, :, :].expand(q, c, l, -1)], dim=3)
+    with torch.inference_mode():
+        probs = torch.sigmoid(head(pairs.reshape(q * c * l, -1))).reshape(q, c, l)
+    probs = probs.masked_fill(~mask[:, None, :], 0.0)
+    out = (probs.sum(dim=2) / mask.sum(dim=1, keepdim=True)).numpy()
+    return np.where(cand >= 0, out, -np.inf)
+
+
+def _load_head(store_dir: Path, dim: int):
+    import torch
+
+    from train_polyvore_pairwise_smoke import _build_heads
+
+    path = store_dir / "head.pt"
+    if not path.exists():
+        raise SystemExit(f"--scorer head needs {path} (train with --export-embeddings)")
+    _proj, head = _build_heads(dim, embed_dim=dim)
+    head.load_state_dict(torch.load(path, map_location="cpu"))
+    return head.eval()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fitb", required=True, help="polyvore_fitb.jsonl")
+    ap.add_argument("--features", required=True, help="Embedding dir in FeatureStore layout")
+    ap.add_argument("--scorer", choices=["cosine", "head"], default="cosine")
+    ap.add_argument("--chunk", type=int, default=2048, help="Questions scored per batch")
+    ap.add_argument("--seed", type=int, default=1337, help="Candidate shuffle seed")
+    args = ap.parse_args()
+
+    import numpy as np
+
+    store_dir = Path(args.features).expanduser().resolve()
+    store = FeatureStore(store_dir)
+
+    t0 = time.perf_counter()
+    ctx, cand, target, skipped = load_questions(Path(args.fitb).expanduser().resolve(), store, args.seed)
+    if not len(target):
+        raise SystemExit(f"No FITB questions resolved against {store_dir} (skipped {skipped})")
+
+    # Gather only the rows the questions reference, once, into a compact float32 matrix.
+    used = np.unique(np.concatenate([ctx[ctx >= 0], cand[cand >= 0]]))
+    local = np.full(int(used.max()) + 1, -1, dtype=np.int64)
+    local[used] = np.arange(len(used))
+    ctx = np.where(ctx >= 0, local[np.maximum(ctx, 0)], -1)
+    cand = np.where(cand >= 0, local[np.maximum(cand, 0)], -1)
+    emb = np.asarray(store.matrix()[used], dtype=np.float32)
+    t_load = time.perf_counter() - t0
+
+    if args.scorer == "cosine":
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+        def score(c, a):
+            return _cosine_scores(emb, c, a)
+    else:
+        head = _load_head(store_dir, store.dim)
+
+        def score(c, a):
+            return _head_scores(head, emb, c, a)
+
+    t1 = time.perf_counter()
+    correct = 0
+    for start in range(0, len(target), args.chunk):
+        sl = slice(start, start + args.chunk)
+        pred = score(ctx[sl], cand[sl]).argmax(axis=1)
+        correct += int((pred == target[sl]).sum())
+    t_score = time.perf_counter() - t1
+
+    n = len(target)
+    chance = float(np.mean(1.0 / (cand >= 0).sum(axis=1)))
+    print(f"FITB accuracy: {correct / n:.4f} ({correct}/{n})  chance={chance:.4f}  scorer={args.scorer}")
+    print(f"Questions: evaluated={n} skipped={skipped} (unresolved items)")
+    print(f"Time: resolve={t_load:.2f}s score={t_score:.2f}s ({n / t_score if t_score else 0.0:.0f} questions/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Precompute frozen-backbone features for Polyvore items and deep_fashion images.
+
+Head experiments (the pairwise trainer's `proj`/`head`, the embedder's `fc`)
+do not need to re-run ResNet-18 every epoch. This tool runs the backbone once
+over every image referenced by the manifests and stores pooled features as a
+float16 memory-mapped matrix; trainers given `--features DIR` then train only
+the heads on those rows.
+
+Layout of the feature dir:
+  features_f16.npy   (N, D) float16, np.load(..., mmap_mode="r")
+  index.json         {"dim": D, "backbone": ..., "keys": {key: row}}
+
+Keys are the same as tools/ml/image_cache.py: Polyvore item_uid, deep_fashion
+absolute image path. The same layout works for any per-item embedding
+matrix, not just backbone features.
+
+Usage:
+  python3 tools/ml/extract_features.py \
+    --polyvore-outfits tools/_out/manifests/polyvore_outfits_with_images.jsonl \
+    --deep-fashion tools/_out/manifests/deep_fashion.jsonl \
+    --out-dir tools/_out/features_resnet18 \
+    --pretrained --num-workers 4
+
+Requires: torch, torchvision, pillow, numpy
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from data_loading import add_loader_args, imagenet_transform, make_loader
+from image_cache import ImageCache, collect_image_keys
+
+
+def _choose_device() -> str:
+    import torch
+
+    if torch.backends.mps.is_available() and torch.backends.mps.is_built():
+        return "mps"
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
+class FeatureStore:
+    """Read side of a feature/embedding dir. Worker-safe: the map is opened lazily."""
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = store_dir
+        with (store_dir / "index.json").open("r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.dim = int(index["dim"])
+        self.backbone = index.get("backbone")
+        self.rows: dict[str, int] = index["keys"]
+        self._arr = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arr"] = None
+        return state
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def matrix(self):
+        """(N, D) float16 memory map."""
+        if self._arr is None:
+            import numpy as np
+
+            self._arr = np.load(self.store_dir / "features_f16.npy", mmap_mode="r")
+        return self._arr
+
+    def rows_for(self, keys: list[str]):
+        """int64 row indices for `keys`; -1 where a key is missing."""
+        import numpy as np
+
+        return np.fromiter((self.rows.get(k, -1) for k in keys), dtype=np.int64, count=len(keys))
+
+
+def save_feature_store(out_dir: Path, keys: list[str], matrix, backbone: str) -> None:
+    """Write an in-memory (N, D) matrix in the layout FeatureStore reads."""
+    import numpy as np
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "features_f16.npy", np.asarray(matrix, dtype=np.float16))
+    with (out_dir / "index.json").open("w", encoding="utf-8") as f:
+        json.dump({"dim": int(matrix.shape[1]), "backbone": backbone, "keys": {k: i for i, k in enumerate(keys)}}, f)
+
+
+class KeyedImageDataset:
+    """(image tensor, position, ok) for each key; unreadable images come back with ok=False."""
+
+    def __init__(self, keys: list[str], paths: list[str], cache: ImageCache | None = None):
+        self.keys = keys
+        self.paths = paths
+        self.cache = cache
+        self._tfm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tfm"] = None
+        return state
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, idx):
+        import torch
+        from PIL import Image
+
+        key = self.keys[idx]
+        if self.cache is not None and key in self.cache:
+            return self.cache.tensor(key), idx, True
+        if self._tfm is None:
+            self._tfm = imagenet_transform()
+        try:
+            return self._tfm(Image.open(self.paths[idx]).convert("RGB")), idx, True
+        except (OSError, ValueError):
+            return torch.zeros(3, 224, 224), idx, False
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--polyvore-outfits", default="", help="polyvore_outfits_with_images.jsonl")
+    ap.add_argument("--deep-fashion", default="", help="deep_fashion.jsonl")
+    ap.add_argument("--out-dir", required=True)
+    ap.add_argument(
+        "--pretrained",
+        action="store_true",
+        help="Use torchvision pretrained weights (may require network access).",
+    )
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--image-cache", default="", help="Pre-resized cache dir from tools/ml/image_cache.py")
+    add_loader_args(ap)
+    args = ap.parse_args()
+
+    if not args.polyvore_outfits and not args.deep_fashion:
+        raise SystemExit("Pass --polyvore-outfits and/or --deep-fashion")
+
+    polyvore = Path(args.polyvore_outfits).expanduser().resolve() if args.polyvore_outfits else None
+    deep_fashion = Path(args.deep_fashion).expanduser().resolve() if args.deep_fashion else None
+    out_dir = Path(args.out_dir).expanduser().resolve()
+    cache = ImageCache(Path(args.image_cache).expanduser().resolve()) if args.image_cache else None
+
+    key_to_path = collect_image_keys(polyvore, deep_fashion)
+    keys = list(key_to_path.keys())
+    if not keys:
+        raise SystemExit("No images referenced by the given manifests")
+
+    import numpy as np
+    import torch
+    import torch.nn as nn
+    from torchvision import models
+
+    device = _choose_device()
+    print(f"Using device: {device}")
+    print(f"Images to embed: {len(keys)}")
+
+    weights = models.ResNet18_Weights.DEFAULT if args.pretrained else None
+    backbone = models.resnet18(weights=weights)
+    dim = backbone.fc.in_features
+    backbone.fc = nn.Identity()
+    backbone = backbone.to(device).eval()
+
+    ds = KeyedImageDataset(keys, [key_to_path[k] for k in keys], cache)
+    dl = make_loader(ds, args, device=device, batch_size=args.batch_size, shuffle=False)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    feats = np.lib.format.open_memmap(out_dir / "features_f16.npy", mode="w+", dtype=np.float16, shape=(len(keys), dim))
+    ok_mask = np.zeros(len(keys), dtype=bool)
+
+    t0 = time.perf_counter()
+    with torch.inference_mode():
+        for x, idx, ok in dl:
+            f = backbone(x.to(device)).to("cpu", torch.float16).numpy()
+            idx = idx.numpy()
+            feats[idx] = f
+            ok_mask[idx] = ok.numpy()
+    feats.flush()
+    del feats
+    elapsed = time.perf_counter() - t0
+
+    # Failed images keep a zero row but are left out of the index.
+    rows = {k: i for i, k in enumerate(keys) if ok_mask[i]}
+    with (out_dir / "index.json").open("w", encoding="utf-8") as f:
+        json.dump({"dim": dim, "backbone": "resnet18" + ("-imagenet" if args.pretrained else "-random"), "keys": rows}, f)
+
+    rate = len(keys) / elapsed if elapsed else 0.0
+    print(f"Embedded: {len(rows)}  failed: {len(keys) - len(rows)}  time: {elapsed:.1f}s ({rate:.1f} img/s)")
+    print(f"Wrote: {out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
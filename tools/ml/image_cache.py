@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Build (and read) a pre-decoded, pre-resized image cache for the trainers.
+
+The embedder and pairwise trainers decode and resize full-resolution JPEGs on
+every access, every epoch; Polyvore items also repeat across many pairs. This
+tool decodes each referenced image once, resizes it to SIZE x SIZE RGB (same
+PIL bilinear resize as torchvision's Resize((SIZE, SIZE))), and stores it in a
+memory-mapped uint8 array. Trainers given `--image-cache DIR` then read pixels
+straight from the map, so multi-epoch training does no JPEG I/O after the build.
+
+Layout of the cache dir:
+  images_u8.npy   (N, SIZE, SIZE, 3) uint8, np.load(..., mmap_mode="r")
+  index.json      {"size": SIZE, "keys": {key: row}}
+
+Keys:
+  Polyvore      item_uid (from polyvore_outfits_with_images.jsonl)
+  deep_fashion  absolute image path (dataset_root / image_relpath)
+
+Usage:
+  python3 tools/ml/image_cache.py \
+    --polyvore-outfits tools/_out/manifests/polyvore_outfits_with_images.jsonl \
+    --deep-fashion tools/_out/manifests/deep_fashion.jsonl \
+    --out-dir tools/_out/image_cache_224 \
+    --workers 0
+
+Requires: numpy, pillow
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from records import DeepFashionRecord, PolyvoreOutfit, iter_records
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def collect_image_keys(polyvore: Path | None, deep_fashion: Path | None) -> dict[str, str]:
+    """Return key -> image path in first-seen order (dedupes repeated items)."""
+    out: dict[str, str] = {}
+    if polyvore is not None:
+        for o in iter_records(polyvore, PolyvoreOutfit):
+            for it in o.items:
+                p = it.local_image_abspath
+                if p and it.item_uid not in out:
+                    out[it.item_uid] = p
+    if deep_fashion is not None:
+        for r in iter_records(deep_fashion, DeepFashionRecord):
+            p = str(Path(r.dataset_root) / r.image_relpath)
+            out.setdefault(p, p)
+    return out
+
+
+def _load_resized(path: str, size: int) -> bytes | None:
+    from PIL import Image
+
+    try:
+        with Image.open(path) as im:
+            im = im.convert("RGB").resize((size, size), Image.BILINEAR)
+            return im.tobytes()
+    except (OSError, ValueError):
+        return None
+
+
+def _load_batch(paths: list[str], size: int) -> list[bytes | None]:
+    return [_load_resized(p, size) for p in paths]
+
+
+class ImageCache:
+    """Read side of the cache. Worker-safe: the memory map is opened lazily per process."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        with (cache_dir / "index.json").open("r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.size = int(index["size"])
+        self.rows: dict[str, int] = index["keys"]
+        self._arr = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arr"] = None
+        return state
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def get(self, key: str):
+        """HWC uint8 view into the memory map."""
+        if self._arr is None:
+            import numpy as np
+
+            self._arr = np.load(self.cache_dir / "images_u8.npy", mmap_mode="r")
+        return self._arr[self.rows[key]]
+
+    def tensor(self, key: str):
+        """CHW float tensor, normalised exactly like data_loading.imagenet_transform()."""
+        import numpy as np
+        import torch
+
+        x = torch.from_numpy(np.array(self.get(key))).permute(2, 0, 1).to(torch.float32).div_(255.0)
+        mean = torch.tensor(IMAGENET_MEAN).view(3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(3, 1, 1)
+        return x.sub_(mean).div_(std)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--polyvore-outfits", default="", help="polyvore_outfits_with_images.jsonl")
+    ap.add_argument("--deep-fashion", default="", help="deep_fashion.jsonl")
+    ap.add_argument("--out-dir", required=True)
+    ap.add_argument("--size", type=int, default=224)
+    ap.add_argument("--workers", type=int, default=0, help="Decode processes (0 = all cores)")
+    ap.add_argument("--batch", type=int, default=256, help="Images per worker task")
+    args = ap.parse_args()
+
+    if not args.polyvore_outfits and not args.deep_fashion:
+        raise SystemExit("Pass --polyvore-outfits and/or --deep-fashion")
+
+    import numpy as np
+
+    polyvore = Path(args.polyvore_outfits).expanduser().resolve() if args.polyvore_outfits else None
+    deep_fashion = Path(args.deep_fashion).expanduser().resolve() if args.deep_fashion else None
+    out_dir = Path(args.out_dir).expanduser().resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    key_to_path = collect_image_keys(polyvore, deep_fashion)
+    keys = list(key_to_path.keys())
+    if not keys:
+        raise SystemExit("No images referenced by the given manifests")
+
+    size = args.size
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    arr = np.lib.format.open_memmap(out_dir / "images_u8.npy", mode="w+", dtype=np.uint8, shape=(len(keys), size, size, 3))
+
+    batches = [keys[i : i + args.batch] for i in range(0, len(keys), args.batch)]
+    path_batches = [[key_to_path[k] for k in b] for b in batches]
+
+    t0 = time.perf_counter()
+    rows: dict[str, int] = {}
+    row = 0
+    failed = 0
+
+    def _store(batch_keys: list[str], results: list[bytes | None]) -> None:
+        nonlocal row, failed
+        for k, data in zip(batch_keys, results):
+            if data is None:
+                failed += 1
+                continue
+            arr[row] = np.frombuffer(data, dtype=np.uint8).reshape(size, size, 3)
+            rows[k] = row
+            row += 1
+
+    if workers <= 1:
+        for bk, bp in zip(batches, path_batches):
+            _store(bk, _load_batch(bp, size))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for bk, results in zip(batches, ex.map(_load_batch, path_batches, [size] * len(path_batches))):
+                _store(bk, results)
+
+    arr.flush()
+    del arr
+    if row < len(keys):
+        # Drop the tail reserved for images that failed to decode.
+        full = np.load(out_dir / "images_u8.npy", mmap_mode="r")
+        tmp = out_dir / "images_u8.tmp.npy"
+        np.save(tmp, full[:row])
+        del full
+        os.replace(tmp, out_dir / "images_u8.npy")
+
+    with (out_dir / "index.json").open("w", encoding="utf-8") as f:
+        json.dump({"size": size, "keys": rows}, f)
+
+    elapsed = time.perf_counter() - t0
+    rate = len(keys) / elapsed if elapsed else 0.0
+    gb = row * size * size * 3 / 1e9
+    print(f"Cached images: {row} ({gb:.2f} GB)  failed: {failed}  time: {elapsed:.1f}s ({rate:.0f} img/s)")
+    print(f"Wrote: {out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Header-only image size probing with a persistent on-disk cache.
+
+Reading width/height via PIL opens and parses each file. For JPEG and PNG the
+size lives in the first few hundred bytes (PNG IHDR chunk, JPEG SOFn marker),
+so we read just that. Anything we cannot parse falls back to PIL.
+
+Sizes are cached in a JSON file keyed by absolute path and validated against
+(mtime_ns, size), so re-runs skip even the header read. The cache is shared
+by the COCO converter and the training/verification scripts.
+
+Usage (standalone, prints sizes):
+  python3 tools/ml/image_size.py path/to/a.jpg path/to/b.png \
+    --cache tools/_out/cache/image_sizes.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+from pathlib import Path
+
+_PNG_SIG = b"\x89PNG\r\n\x1a\n"
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not.
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(f) -> tuple[int, int] | None:
+    # Caller has consumed the SOI marker (FF D8).
+    while True:
+        b = f.read(1)
+        while b and b != b"\xff":
+            b = f.read(1)
+        while b == b"\xff":
+            b = f.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            # Standalone markers without a length field.
+            continue
+        if marker == 0xD9:
+            return None
+        seg = f.read(2)
+        if len(seg) != 2:
+            return None
+        (seg_len,) = struct.unpack(">H", seg)
+        if marker in _JPEG_SOF:
+            data = f.read(5)
+            if len(data) != 5:
+                return None
+            _precision, height, width = struct.unpack(">BHH", data)
+            if width <= 0 or height <= 0:
+                return None
+            return width, height
+        f.seek(seg_len - 2, os.SEEK_CUR)
+
+
+def probe_stream_size(f) -> tuple[int, int] | None:
+    """(width, height) from the header of a seekable binary file positioned at 0."""
+    head = f.read(24)
+    if head.startswith(_PNG_SIG) and head[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", head[16:24])
+        return int(width), int(height)
+    if head[:2] == b"\xff\xd8":
+        f.seek(2)
+        return _jpeg_size(f)
+    return None
+
+
+def probe_image_size(path: Path | str) -> tuple[int, int] | None:
+    """Return (width, height) from the file header, or None if unrecognised."""
+    with open(path, "rb") as f:
+        return probe_stream_size(f)
+
+
+def read_image_size(path: Path | str) -> tuple[int, int]:
+    """Header probe with a PIL fallback for formats we do not parse."""
+    size = probe_image_size(path)
+    if size is not None:
+        return size
+    from PIL import Image
+
+    with Image.open(path) as im:
+        return im.size
+
+
+class ImageSizeCache:
+    """(width, height) cache keyed by path, invalidated on mtime/size change.
+
+    `get()` returns the cached size when the file is unchanged and otherwise
+    probes it. New entries are tracked separately so worker processes can hand
+    them back to the parent via `drain_new()` / `update()`.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path
+        self._entries: dict[str, list[int]] = {}
+        self._new: dict[str, list[int]] = {}
+        if path is not None and path.exists():
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._entries = data
+            except (OSError, ValueError):
+                # A corrupt cache is just a cold cache.
+                self._entries = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: Path | str) -> tuple[int, int]:
+        key = os.fspath(path)
+        st = os.stat(key)
+        hit = self._entries.get(key)
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            return hit[2], hit[3]
+        width, height = read_image_size(key)
+        entry = [st.st_mtime_ns, st.st_size, int(width), int(height)]
+        self._entries[key] = entry
+        self._new[key] = entry
+        return int(width), int(height)
+
+    def drain_new(self) -> dict[str, list[int]]:
+        new, self._new = self._new, {}
+        return new
+
+    def update(self, entries: dict[str, list[int]]) -> None:
+        if entries:
+            self._entries.update(entries)
+            self._new.update(entries)
+
+    def save(self) -> None:
+        if self.path is None or not self._new:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+        self._new = {}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("images", nargs="+")
+    ap.add_argument("--cache", default="", help="Optional persistent size cache JSON")
+    args = ap.parse_args()
+
+    cache = ImageSizeCache(Path(args.cache).expanduser().resolve() if args.cache else None)
+    for p in args.images:
+        path = Path(p).expanduser().resolve()
+        width, height = cache.get(path)
+        print(f"{path}\t{width}x{height}")
+    cache.save()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
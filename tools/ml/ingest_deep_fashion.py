@@ -31,6 +31,9 @@ from collections import Counter, defaultdict
 from dataclasses import dataclass
 from pathlib import Path
 
+from manifest_columnar import ManifestWriter
+from records import DeepFashionRecord
+
 
 @dataclass(frozen=True)
 class ImageRecord:
@@ -117,6 +120,12 @@ def main() -> int:
     parser.add_argument("--dataset-root", required=True, help="Path to deep_fashion root")
     parser.add_argument("--out-manifest", required=True, help="Output JSONL path")
     parser.add_argument("--out-stats", default="", help="Optional output stats JSON")
+    parser.add_argument(
+        "--columnar",
+        choices=["arrow", "parquet"],
+        default="",
+        help="Also write each manifest as .arrow/.parquet next to the JSONL (needs pyarrow)",
+    )
     args = parser.parse_args()
 
     dataset_root = Path(args.dataset_root).expanduser().resolve()
@@ -148,7 +157,7 @@ def main() -> int:
 
     # Emit one record per image in images/*.
     ordered = sorted(images, key=lambda r: (r.split, r.image_id))
-    with out_path.open("w", encoding="utf-8") as f:
+    with ManifestWriter(out_path, DeepFashionRecord, args.columnar) as f:
         for img in ordered:
             meta_rows = by_image.get(img.image_id, [])
 
@@ -198,7 +207,7 @@ def main() -> int:
                 "occasions": occasions,
                 "ratings": ratings,
             }
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.write(record)
 
     stats = {
         "dataset_root": str(dataset_root),
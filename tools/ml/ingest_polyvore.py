@@ -6,9 +6,14 @@ This supports the file layout produced by tools/ml/download_polyvore_metadata.sh
 Outputs:
 - A JSONL file of outfit records (train/val/test)
 - A JSONL file of FITB questions (test only)
+- Optionally (--out-compat), a JSONL file of compatibility-labelled outfits
 
 We intentionally keep this stdlib-only.
 
+With --stream, split and FITB files are read incrementally (one top-level
+array element at a time), so peak memory is bounded by a single outfit plus
+the read buffer, and output starts immediately. Output is identical either way.
+
 Usage:
   python3 tools/ml/ingest_polyvore.py \
     --polyvore-dir "Datasets/polyvore" \
@@ -20,14 +25,73 @@ from __future__ import annotations
 
 import argparse
 import json
+import re
 from pathlib import Path
 
+from manifest_columnar import ManifestWriter
+from polyvore_compat import parse_compat_file
+from records import CompatOutfit, FitbQuestion, PolyvoreOutfit
+
 
 def _read_json(path: Path):
     with path.open("r", encoding="utf-8") as f:
         return json.load(f)
 
 
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+def _iter_json_array(path: Path, chunk_size: int = 1 << 20):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with path.open("r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        state = "start"  # start -> first -> (value -> sep)*
+        while True:
+            pos = _WS.match(buf, pos).end()
+            need_more = pos == len(buf)
+            if not need_more:
+                ch = buf[pos]
+                if state == "start":
+                    if ch != "[":
+                        raise SystemExit(f"Unexpected JSON structure in {path} (expected a list)")
+                    pos += 1
+                    state = "first"
+                    continue
+                if state in ("first", "sep") and ch == "]":
+                    return
+                if state == "sep":
+                    if ch != ",":
+                        raise SystemExit(f"Malformed JSON array in {path} near offset {pos}")
+                    pos += 1
+                    state = "value"
+                    continue
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # Only accept a value once its ',' or ']' is buffered: a number cut
+                    # at the chunk edge ("2." of "2.5") decodes fine but is incomplete.
+                    nxt = _WS.match(buf, end).end()
+                    need_more = not eof and (nxt == len(buf) or buf[nxt] not in ",]")
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    need_more = True
+                if not need_more:
+                    yield obj
+                    pos = end
+                    state = "sep"
+                    continue
+            if eof:
+                raise SystemExit(f"Truncated JSON array in {path}")
+            # Grow reads with the pending element so huge elements are not re-decoded per chunk.
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
 def _pick_fitb_file(root: Path) -> Path:
     for name in ("fill_in_blank_test.json", "fill_in_the_blank_test.json"):
         p = root / name
@@ -49,6 +113,18 @@ def main() -> int:
     ap.add_argument("--polyvore-dir", required=True)
     ap.add_argument("--out-outfits", required=True)
     ap.add_argument("--out-fitb", required=True)
+    ap.add_argument("--out-compat", default="", help="Optional JSONL of parsed compatibility outfits")
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse JSON files incrementally (bounded memory) instead of loading them whole",
+    )
+    ap.add_argument(
+        "--columnar",
+        choices=["arrow", "parquet"],
+        default="",
+        help="Also write each manifest as .arrow/.parquet next to the JSONL (needs pyarrow)",
+    )
     args = ap.parse_args()
 
     root = Path(args.polyvore_dir).expanduser().resolve()
@@ -69,13 +145,16 @@ def main() -> int:
     outfits_written = 0
     items_written = 0
 
-    with out_outfits.open("w", encoding="utf-8") as f:
+    with ManifestWriter(out_outfits, PolyvoreOutfit, args.columnar) as f:
         for split, path in split_map.items():
             if not path.exists():
                 raise SystemExit(f"Missing split file: {path}")
-            outfits = _read_json(path)
-            if not isinstance(outfits, list):
-                raise SystemExit(f"Unexpected JSON structure in {path}")
+            if args.stream:
+                outfits = _iter_json_array(path)
+            else:
+                outfits = _read_json(path)
+                if not isinstance(outfits, list):
+                    raise SystemExit(f"Unexpected JSON structure in {path}")
 
             for o in outfits:
                 set_id = str(o.get("set_id", ""))
@@ -110,41 +189,46 @@ def main() -> int:
                     "desc": o.get("desc"),
                     "items": norm_items,
                 }
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                f.write(rec)
                 outfits_written += 1
 
     # FITB questions
     fitb_path = _pick_fitb_file(root)
-    fitb = _read_json(fitb_path)
+    fitb = _iter_json_array(fitb_path) if args.stream else _read_json(fitb_path)
     fitb_written = 0
 
-    with out_fitb.open("w", encoding="utf-8") as f:
+    with ManifestWriter(out_fitb, FitbQuestion, args.columnar) as f:
         # Expected: list[dict]
         for q in fitb:
             qid = q.get("question")
             blank_pos = q.get("blank_position")
             answers = q.get("answers") or []
             f.write(
-                json.dumps(
-                    {
-                        "source": "polyvore",
-                        "question_id": qid,
-                        "blank_position": blank_pos,
-                        "answers": answers,
-                        "correct_answer": answers[0] if answers else None,
-                    },
-                    ensure_ascii=False,
-                )
-                + "\n"
+                {
+                    "source": "polyvore",
+                    "question_id": qid,
+                    "blank_position": blank_pos,
+                    "answers": answers,
+                    "correct_answer": answers[0] if answers else None,
+                }
             )
             fitb_written += 1
 
-    # Compatibility labels file presence check (we don't parse it yet; different formats exist).
-    _ = _pick_compat_file(root)
+    # Compatibility labels (this layout's file is the maryland format; see polyvore_compat.py).
+    compat_path = _pick_compat_file(root)
+    if args.out_compat:
+        compat = parse_compat_file(compat_path)
+        out_compat = Path(args.out_compat).expanduser().resolve()
+        out_compat.parent.mkdir(parents=True, exist_ok=True)
+        with ManifestWriter(out_compat, CompatOutfit, args.columnar) as f:
+            for i in range(len(compat)):
+                f.write({"source": "polyvore", "label": compat.labels[i], "item_uids": compat.outfit(i)})
 
     print(f"Wrote outfits: {outfits_written} -> {out_outfits}")
     print(f"Wrote FITB questions: {fitb_written} -> {out_fitb}")
     print(f"Total items referenced (first 8 per outfit): {items_written}")
+    if args.out_compat:
+        print(f"Wrote compatibility outfits: {len(compat)} -> {out_compat}")
     return 0
 
 
@@ -14,9 +14,11 @@ from __future__ import annotations
 
 import argparse
 import csv
-import json
 from pathlib import Path
 
+from manifest_columnar import ManifestWriter
+from records import SopInteraction
+
 
 def _iter_csv_rows(path: Path):
     with path.open("r", encoding="utf-8") as f:
@@ -29,6 +31,12 @@ def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--sop-dir", required=True)
     ap.add_argument("--out", required=True)
+    ap.add_argument(
+        "--columnar",
+        choices=["arrow", "parquet"],
+        default="",
+        help="Also write each manifest as .arrow/.parquet next to the JSONL (needs pyarrow)",
+    )
     args = ap.parse_args()
 
     root = Path(args.sop_dir).expanduser().resolve()
@@ -44,7 +52,7 @@ def main() -> int:
         raise SystemExit(f"No SOP CSVs found under: {root}")
 
     written = 0
-    with out_path.open("w", encoding="utf-8") as f:
+    with ManifestWriter(out_path, SopInteraction, args.columnar) as f:
         for p in candidates:
             name = p.name
             # crude split inference from filename
@@ -64,7 +72,7 @@ def main() -> int:
                     "outfit_id": row.get("outfit_id"),
                     "matched": row.get("matched"),
                 }
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                f.write(rec)
                 written += 1
 
     print(f"Wrote SOP interactions: {written} -> {out_path}")
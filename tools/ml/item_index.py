@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Nearest-neighbour index over item embeddings for outfit completion lookups.
+
+Input is any FeatureStore-layout dir (see tools/ml/extract_features.py), e.g.
+the `proj` embeddings written by
+
+  python3 tools/ml/train_polyvore_pairwise_smoke.py ... --export-embeddings DIR
+
+keyed by Polyvore item_uid ("polyvore:<set_id>_<index>", as in
+index_polyvore_images.py). Vectors are L2-normalised and scored by cosine
+similarity.
+
+Two index kinds:
+  exact   brute-force matrix-vector product over all items (the baseline)
+  ivfpq   inverted file (k-means coarse lists) + product-quantised residuals.
+          A query scans only `nprobe` lists with a per-query lookup table,
+          then re-ranks the best `refine` candidates against the exact vectors.
+
+Layout of the index dir (every array is np.load(..., mmap_mode="r")):
+  meta.json          {"kind", "dim", "count", ...build params}
+  keys.json          [key, ...] in row order
+  vectors_f32.npy    (N, D) unit-norm float32
+  ivfpq only:
+  centroids.npy      (nlist, D) float32
+  list_offsets.npy   (nlist + 1,) int64, list l owns positions [off[l], off[l+1])
+  list_rows.npy      (N,) int32, row ids grouped by list
+  pq_codebooks.npy   (M, K, D / M) float32
+  pq_codes.npy       (N, M) uint8, grouped by list like list_rows
+
+Usage:
+  python3 tools/ml/item_index.py build \
+    --embeddings tools/_out/embeddings/pairwise_proj \
+    --out-dir tools/_out/item_index --kind ivfpq
+
+  python3 tools/ml/item_index.py query --index tools/_out/item_index \
+    --item polyvore:209512492_1 --k 10
+
+  python3 tools/ml/item_index.py bench --index tools/_out/item_index --queries 500
+
+Requires: numpy
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+from extract_features import FeatureStore
+
+
+def _normalise(x):
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _assign(x, centroids, chunk: int = 16384):
+    """Nearest centroid (squared L2) for each row of x, in chunks to bound memory."""
+    import numpy as np
+
+    c_sq = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        xb = x[start : start + chunk]
+        out[start : start + len(xb)] = np.argmin(c_sq[None, :] - 2.0 * (xb @ centroids.T), axis=1)
+    return out
+
+
+def _kmeans(x, k: int, iters: int, rng, max_train: int = 65536):
+    """Plain Lloyd's k-means on a random sample of at most `max_train` rows."""
+    import numpy as np
+
+    if len(x) > max_train:
+        x = x[rng.choice(len(x), max_train, replace=False)]
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        a = _assign(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, a, x)
+        counts = np.bincount(a, minlength=k)
+        live = counts > 0
+        centroids[live] = sums[live] / counts[live, None]
+        # Re-seed empty clusters from random points so k stays meaningful.
+        dead = np.flatnonzero(~live)
+        if len(dead):
+            centroids[dead] = x[rng.choice(len(x), len(dead), replace=False)]
+    return centroids.astype(np.float32)
+
+
+def build_index(
+    store: FeatureStore,
+    out_dir: Path,
+    kind: str = "ivfpq",
+    key_prefix: str = "",
+    nlist: int = 0,
+    m: int = 0,
+    iters: int = 20,
+    seed: int = 1337,
+) -> dict:
+    import numpy as np
+
+    keys = [k for k in store.rows if k.startswith(key_prefix)]
+    if not keys:
+        raise SystemExit(f"No keys with prefix {key_prefix!r} in {store.store_dir}")
+    vectors = _normalise(store.matrix()[store.rows_for(keys)])
+    n, dim = vectors.shape
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "vectors_f32.npy", vectors)
+    with (out_dir / "keys.json").open("w", encoding="utf-8") as f:
+        json.dump(keys, f)
+
+    meta = {"kind": kind, "dim": dim, "count": n, "source": str(store.store_dir), "backbone": store.backbone}
+    if kind == "ivfpq":
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or max(1, int(4 * math.sqrt(n))), n)
+        m = m or max(1, dim // 8)
+        if dim % m:
+            raise SystemExit(f"--m {m} must divide the embedding dim {dim}")
+        sub = dim // m
+
+        centroids = _kmeans(vectors, nlist, iters, rng)
+        nlist = len(centroids)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+
+        # PQ on residuals: q.x ~= q.c + q.r, and q.r splits into per-subspace
+        # dot products, so one (M, K) lookup table per query covers every list.
+        residuals = vectors - centroids[assign]
+        ksub = min(256, n)
+        codebooks = np.zeros((m, ksub, sub), dtype=np.float32)
+        codes = np.zeros((n, m), dtype=np.uint8)
+        for j in range(m):
+            part = np.ascontiguousarray(residuals[:, j * sub : (j + 1) * sub])
+            cb = _kmeans(part, ksub, iters, rng)
+            codebooks[j, : len(cb)] = cb
+            codes[:, j] = _assign(part, cb)
+
+        np.save(out_dir / "centroids.npy", centroids)
+        np.save(out_dir / "list_offsets.npy", offsets)
+        np.save(out_dir / "list_rows.npy", order.astype(np.int32))
+        np.save(out_dir / "pq_codebooks.npy", codebooks)
+        np.save(out_dir / "pq_codes.npy", codes[order])
+        meta.update({"nlist": nlist, "m": m, "ksub": ksub, "iters": iters, "seed": seed})
+    elif kind != "exact":
+        raise SystemExit(f"Unknown index kind: {kind}")
+
+    with (out_dir / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class ItemIndex:
+    """Memory-mapped read side. `search()` takes one query vector, `neighbours()` an item key."""
+
+    def __init__(self, index_dir: Path):
+        import numpy as np
+
+        self.index_dir = index_dir
+        with (index_dir / "meta.json").open("r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with (index_dir / "keys.json").open("r", encoding="utf-8") as f:
+            self.keys: list[str] = json.load(f)
+        self.rows = {k: i for i, k in enumerate(self.keys)}
+        self.kind = self.meta["kind"]
+
+        def _load(name):
+            return np.load(index_dir / name, mmap_mode="r")
+
+        self.vectors = _load("vectors_f32.npy")
+        if self.kind == "ivfpq":
+            self.centroids = _load("centroids.npy")
+            self.offsets = _load("list_offsets.npy")
+            self.list_rows = _load("list_rows.npy")
+            self.codebooks = _load("pq_codebooks.npy")
+            self.codes = _load("pq_codes.npy")
+            self._sub_idx = np.arange(self.codebooks.shape[0])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _top(self, scores, rows, k: int):
+        import numpy as np
+
+        if len(scores) > k:
+            part = np.argpartition(-scores, k)[:k]
+            scores, rows = scores[part], rows[part]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], rows[order]
+
+    def search_exact(self, q, k: int = 10):
+        """(scores, rows) of the k most similar items, by brute force."""
+        import numpy as np
+
+        q = _normalise(q)
+        scores = self.vectors @ q
+        return self._top(scores, np.arange(len(scores)), k)
+
+    def search(self, q, k: int = 10, nprobe: int = 16, refine: int = 0):
+        """(scores, rows) of the k most similar items.
+
+        ivfpq: scan `nprobe` lists with PQ scores, then re-rank the top
+        `refine` (default 10 * k) candidates exactly. exact: brute force.
+        """
+        import numpy as np
+
+        if self.kind == "exact":
+            return self.search_exact(q, k)
+
+        q = _normalise(q)
+        coarse = self.centroids @ q
+        nprobe = min(nprobe, len(coarse))
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+
+        m, ksub, sub = self.codebooks.shape
+        lut = np.einsum("mks,ms->mk", self.codebooks, q.reshape(m, sub))
+
+        spans = [(int(self.offsets[l]), int(self.offsets[l + 1])) for l in probe]
+        spans = [(a, b, float(coarse[l])) for (a, b), l in zip(spans, probe) if b > a]
+        if not spans:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        codes = np.concatenate([self.codes[a:b] for a, b, _ in spans])
+        rows = np.concatenate([self.list_rows[a:b] for a, b, _ in spans]).astype(np.int64)
+        base = np.concatenate([np.full(b - a, c, dtype=np.float32) for a, b, c in spans])
+        approx = base + lut[self._sub_idx, codes].sum(axis=1)
+
+        refine = max(k, refine or 10 * k)
+        _, cand = self._top(approx, rows, refine)
+        # Sorted row order keeps the memory-mapped gather sequential.
+        cand = np.sort(cand)
+        return self._top(self.vectors[cand] @ q, cand, k)
+
+    def neighbours(self, key: str, k: int = 10, **kw) -> list[tuple[str, float]]:
+        """Top-k items most similar to `key`, excluding the item itself."""
+        row = self.rows[key]
+        scores, rows = self.search(self.vectors[row], k + 1, **kw)
+        return [(self.keys[r], float(s)) for s, r in zip(scores, rows) if r != row][:k]
+
+
+def _cmd_build(args: argparse.Namespace) -> int:
+    store = FeatureStore(Path(args.embeddings).expanduser().resolve())
+    out_dir = Path(args.out_dir).expanduser().resolve()
+    t0 = time.perf_counter()
+    meta = build_index(store, out_dir, args.kind, args.key_prefix, args.nlist, args.m, args.iters, args.seed)
+    elapsed = time.perf_counter() - t0
+    params = " ".join(f"{k}={meta[k]}" for k in ("nlist", "m", "ksub") if k in meta)
+    print(f"Built {meta['kind']} index: items={meta['count']} dim={meta['dim']} {params} time={elapsed:.1f}s")
+    print(f"Wrote: {out_dir}")
+    return 0
+
+
+def _cmd_query(args: argparse.Namespace) -> int:
+    index = ItemIndex(Path(args.index).expanduser().resolve())
+    if args.item not in index.rows:
+        raise SystemExit(f"Unknown item: {args.item}")
+    t0 = time.perf_counter()
+    hits = index.neighbours(args.item, args.k, nprobe=args.nprobe, refine=args.refine)
+    ms = (time.perf_counter() - t0) * 1000.0
+    for key, score in hits:
+        print(f"{score:.4f}\t{key}")
+    print(f"({index.kind}, {ms:.2f} ms)")
+    return 0
+
+
+def _cmd_bench(args: argparse.Namespace) -> int:
+    import numpy as np
+
+    index = ItemIndex(Path(args.index).expanduser().resolve())
+    rng = np.random.default_rng(args.seed)
+    qrows = rng.choice(len(index), min(args.queries, len(index)), replace=False)
+
+    def _run(fn):
+        times, results = [], []
+        for r in qrows:
+            q = np.asarray(index.vectors[r])
+            t0 = time.perf_counter()
+            _, rows = fn(q)
+            times.append(time.perf_counter() - t0)
+            results.append(rows)
+        return np.asarray(times) * 1000.0, results
+
+    exact_ms, exact = _run(lambda q: index.search_exact(q, args.k))
+    approx_ms, approx = _run(lambda q: index.search(q, args.k, nprobe=args.nprobe, refine=args.refine))
+    recall = np.mean([len(set(a.tolist()) & set(e.tolist())) / max(1, len(e)) for a, e in zip(approx, exact)])
+
+    for name, ms in (("exact", exact_ms), (index.kind, approx_ms)):
+        print(f"{name:6s} p50={np.percentile(ms, 50):.2f}ms p99={np.percentile(ms, 99):.2f}ms mean={ms.mean():.2f}ms")
+    print(f"items={len(index)} queries={len(qrows)} k={args.k} nprobe={args.nprobe} recall@{args.k}={recall:.3f}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    sp = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sp.add_parser("build", help="Build an index from a FeatureStore-layout embeddings dir")
+    b.add_argument("--embeddings", required=True)
+    b.add_argument("--out-dir", required=True)
+    b.add_argument("--kind", choices=["exact", "ivfpq"], default="ivfpq")
+    b.add_argument("--key-prefix", default="polyvore:", help="Only index keys with this prefix ('' = all)")
+    b.add_argument("--nlist", type=int, default=0, help="Coarse lists (0 = 4 * sqrt(N))")
+    b.add_argument("--m", type=int, default=0, help="PQ subspaces (0 = dim / 8)")
+    b.add_argument("--iters", type=int, default=20, help="k-means iterations")
+    b.add_argument("--seed", type=int, default=1337)
+    b.set_defaults(fn=_cmd_build)
+
+    for name, fn in (("query", _cmd_query), ("bench", _cmd_bench)):
+        q = sp.add_parser(name)
+        q.add_argument("--index", required=True)
+        q.add_argument("--k", type=int, default=10)
+        q.add_argument("--nprobe", type=int, default=16, help="ivfpq: lists scanned per query")
+        q.add_argument("--refine", type=int, default=0, help="ivfpq: candidates re-ranked exactly (0 = 10 * k)")
+        q.set_defaults(fn=fn)
+    sp.choices["query"].add_argument("--item", required=True, help="item_uid to find neighbours for")
+    sp.choices["bench"].add_argument("--queries", type=int, default=200)
+    sp.choices["bench"].add_argument("--seed", type=int, default=1337)
+
+    args = ap.parse_args()
+    return args.fn(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
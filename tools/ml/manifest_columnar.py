@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Optional columnar (Arrow IPC / Parquet) copies of the JSONL manifests.
+
+Ingest scripts given `--columnar arrow|parquet` also write their manifest as
+`<same stem>.arrow` (Arrow IPC file) or `<same stem>.parquet` next to the
+JSONL. The schema comes from the record types in records.py, and nested
+items become list<struct> columns. Trainers accept those files wherever they
+take a manifest. Arrow IPC files are memory-mapped (zero-copy). Both formats
+can be read column-by-column with a filter, e.g. split == "train", so
+counting categories is a column scan rather than a parse of every row.
+
+Usage (reading):
+  from manifest_columnar import read_table
+  t = read_table(path, columns=["split", "items"], filter=("split", "train"))
+
+Requires: pyarrow (only when --columnar is used or a columnar manifest is read)
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import types
+import typing
+from pathlib import Path
+
+from manifest_io import JsonlWriter
+
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def _arrow_type(tp):
+    import pyarrow as pa
+
+    origin = typing.get_origin(tp)
+    if origin in (typing.Union, types.UnionType):
+        (inner,) = [a for a in typing.get_args(tp) if a is not type(None)]
+        return _arrow_type(inner)
+    if origin is list:
+        (elem,) = typing.get_args(tp)
+        return pa.list_(_arrow_type(elem))
+    if dataclasses.is_dataclass(tp):
+        return pa.struct(_arrow_fields(tp))
+    return {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}[tp]
+
+
+def _arrow_fields(cls):
+    import pyarrow as pa
+
+    hints = typing.get_type_hints(cls)
+    return [pa.field(f.name, _arrow_type(hints[f.name])) for f in dataclasses.fields(cls)]
+
+
+def arrow_schema(cls):
+    """Arrow schema for a records.py dataclass."""
+    import pyarrow as pa
+
+    return pa.schema(_arrow_fields(cls))
+
+
+def columnar_path(jsonl_path: Path, fmt: str) -> Path:
+    return jsonl_path.with_suffix(FORMATS[fmt])
+
+
+def is_columnar(path: Path) -> bool:
+    return path.suffix in FORMATS.values()
+
+
+class ColumnarWriter:
+    """Buffer dict rows and write them as record batches of `batch_rows`."""
+
+    def __init__(self, path: Path, cls, batch_rows: int = 8192):
+        import pyarrow as pa
+
+        self.path = path
+        self.schema = arrow_schema(cls)
+        self.batch_rows = batch_rows
+        self._rows: list[dict] = []
+        self._sink = None
+        if path.suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self._sink = pa.OSFile(str(path), "wb")
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def write(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        import pyarrow as pa
+
+        if self._rows:
+            batch = pa.RecordBatch.from_pylist(self._rows, schema=self.schema)
+            if self._sink is not None:
+                self._writer.write_batch(batch)
+            else:
+                self._writer.write_table(pa.Table.from_batches([batch]))
+            self._rows = []
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            if self._sink is not None:
+                self._sink.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ManifestWriter:
+    """JSONL writer that also writes a columnar copy when `columnar` is "arrow" or "parquet"."""
+
+    def __init__(self, jsonl_path: Path, cls, columnar: str = ""):
+        self.jsonl = JsonlWriter(jsonl_path)
+        self.columnar = ColumnarWriter(columnar_path(jsonl_path, columnar), cls) if columnar else None
+
+    @property
+    def count(self) -> int:
+        return self.jsonl.count
+
+    def write(self, row: dict) -> None:
+        self.jsonl.write(row)
+        if self.columnar is not None:
+            self.columnar.write(row)
+
+    def close(self) -> None:
+        self.jsonl.close()
+        if self.columnar is not None:
+            self.columnar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_table(path: Path, columns: list[str] | None = None, filter: tuple[str, object] | None = None):
+    """Load a columnar manifest (memory-mapped for Arrow IPC), optionally projecting
+    `columns` and keeping rows where column `filter[0]` equals `filter[1]`."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        filters = [(filter[0], "=", filter[1])] if filter else None
+        return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    if filter:
+        table = table.filter(pc.equal(table[filter[0]], filter[1]))
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def list_field(table, list_column: str, field: str):
+    """Flatten struct field `field` of a list<struct> column.
+
+    Returns (offsets, values): row i owns values[offsets[i]:offsets[i+1]].
+    """
+    import numpy as np
+    import pyarrow.compute as pc
+
+    col = table[list_column].combine_chunks()
+    offsets = np.asarray(col.offsets, dtype=np.int64) - int(col.offsets[0].as_py())
+    values = pc.struct_field(col.flatten(), field)
+    return offsets, values
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""JSONL manifest reading/writing with a pluggable JSON backend.
+
+Every ingest/augment/train script reads and writes its JSONL manifests through
+`iter_jsonl` / `JsonlWriter`, so a faster JSON library speeds all of them up
+when it is installed:
+
+  orjson   fastest encode and decode
+  msgspec  close second
+  json     stdlib fallback (always available)
+
+The first importable backend wins; set PRISMSTYLE_JSON_BACKEND=orjson|msgspec|json
+to force one. With the stdlib backend, output lines are byte-identical to
+`json.dumps(obj, ensure_ascii=False)`. orjson/msgspec write compact separators
+(`{"a":1}`) for the same data. Every reader accepts either form.
+
+Files are read and written as bytes with a large buffer. Writes are batched:
+encoded lines are joined and written every `batch` records.
+
+Compare backends on real manifests with tools/ml/bench_manifest_io.py.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+_BUFFER = 1 << 20
+
+
+class _Backend:
+    def __init__(self, name: str, loads, dumps):
+        self.name = name
+        self.loads = loads  # bytes -> obj
+        self.dumps = dumps  # obj -> bytes (no trailing newline)
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _make_backend(name: str) -> _Backend:
+    """Raise ImportError if `name` is not installed."""
+    if name == "orjson":
+        import orjson
+
+        def dumps(obj) -> bytes:
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                # Non-str keys, ints beyond 64 bits, ...: defer to the stdlib.
+                return _stdlib_dumps(obj)
+
+        return _Backend("orjson", orjson.loads, dumps)
+    if name == "msgspec":
+        import msgspec
+
+        encoder = msgspec.json.Encoder()
+        decoder = msgspec.json.Decoder()
+        return _Backend("msgspec", decoder.decode, encoder.encode)
+    if name == "json":
+        return _Backend("json", json.loads, _stdlib_dumps)
+    raise ValueError(f"Unknown JSON backend: {name} (choose from {', '.join(BACKENDS)})")
+
+
+def available_backends() -> list[str]:
+    out = []
+    for name in BACKENDS:
+        try:
+            _make_backend(name)
+        except ImportError:
+            continue
+        out.append(name)
+    return out
+
+
+_backend: _Backend | None = None
+
+
+def get_backend(name: str | None = None) -> _Backend:
+    """The named backend, or the process-wide default (env override, else first installed)."""
+    global _backend
+    if name is not None:
+        return _make_backend(name)
+    if _backend is None:
+        forced = os.environ.get("PRISMSTYLE_JSON_BACKEND")
+        if forced:
+            _backend = _make_backend(forced)
+        else:
+            _backend = _make_backend(available_backends()[0])
+    return _backend
+
+
+def loads(data: bytes | str):
+    return get_backend().loads(data)
+
+
+def dumps(obj) -> str:
+    return get_backend().dumps(obj).decode("utf-8")
+
+
+def iter_jsonl(path: Path, backend: _Backend | None = None):
+    """Yield one object per non-blank line."""
+    decode = (backend or get_backend()).loads
+    with open(path, "rb", buffering=_BUFFER) as f:
+        for line in f:
+            if line.strip():
+                yield decode(line)
+
+
+def read_jsonl(path: Path) -> list:
+    return list(iter_jsonl(path))
+
+
+class JsonlWriter:
+    """Buffered JSONL writer; use as a context manager.
+
+    Lines are encoded as they are written and flushed to disk in batches of
+    `batch` records.
+    """
+
+    def __init__(self, path: Path, batch: int = 1024, backend: _Backend | None = None):
+        self.path = path
+        self.batch = batch
+        self.count = 0
+        self._dumps = (backend or get_backend()).dumps
+        self._pending: list[bytes] = []
+        self._f = open(path, "wb", buffering=_BUFFER)
+
+    def write(self, obj) -> None:
+        self._pending.append(self._dumps(obj))
+        self.count += 1
+        if len(self._pending) >= self.batch:
+            self._flush()
+
+    def write_many(self, objs) -> None:
+        for obj in objs:
+            self.write(obj)
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._pending.append(b"")
+            self._f.write(b"\n".join(self._pending))
+            self._pending = []
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Parse Polyvore outfit-compatibility label files into a compact CSR layout.
+
+Two formats exist, with the same line shape `<label> <tok> <tok> ...`:
+
+  maryland  fashion_compatibility_prediction.txt (Han et al., the layout
+            download_polyvore_metadata.sh fetches). Each token is
+            `<set_id>_<index>`, i.e. our item_uid without the "polyvore:" prefix.
+  vasileva  compatibility_{train,valid,test}.txt (Polyvore Outfits). Each token
+            is `<outfit_id>_<index>` and must be resolved to an item_id through
+            the split's outfits JSON (`[{"set_id", "items": [{"item_id", "index"}]}]`).
+
+Both parse into `CompatOutfits`: one label per outfit plus a flat item array
+indexed by `offsets` (outfit i owns items[offsets[i]:offsets[i+1]]), with
+items stored as indices into a deduplicated key list.
+
+Stdlib-only, so ingest_polyvore.py can use it; tools/ml/eval_compat.py scores it.
+"""
+
+from __future__ import annotations
+
+import json
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class CompatOutfits:
+    keys: list[str] = field(default_factory=list)
+    labels: array = field(default_factory=lambda: array("b"))
+    offsets: array = field(default_factory=lambda: array("q", [0]))
+    items: array = field(default_factory=lambda: array("i"))
+    unresolved: int = 0
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def outfit(self, i: int) -> list[str]:
+        return [self.keys[j] for j in self.items[self.offsets[i] : self.offsets[i + 1]]]
+
+
+def load_outfit_item_ids(json_paths: list[Path]) -> dict[str, str]:
+    """`<set_id>_<index>` -> item_id from Polyvore Outfits split JSON files."""
+    out: dict[str, str] = {}
+    for path in json_paths:
+        with path.open("r", encoding="utf-8") as f:
+            outfits = json.load(f)
+        for o in outfits:
+            set_id = str(o.get("set_id", ""))
+            for it in o.get("items") or []:
+                out[f"{set_id}_{it.get('index')}"] = str(it.get("item_id"))
+    return out
+
+
+def parse_compat_file(path: Path, item_ids: dict[str, str] | None = None, key_prefix: str = "polyvore:") -> CompatOutfits:
+    """Parse a compatibility file; pass `item_ids` (load_outfit_item_ids) for the vasileva format.
+
+    maryland keys are item_uids (`key_prefix` + token); vasileva keys are
+    `key_prefix` + item_id. Outfits with a token missing from `item_ids` are
+    counted in `unresolved` and skipped.
+    """
+    out = CompatOutfits()
+    key_index: dict[str, int] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            toks = parts[1:]
+            if item_ids is not None:
+                resolved = [item_ids.get(t) for t in toks]
+                if None in resolved:
+                    out.unresolved += 1
+                    continue
+                toks = resolved
+            for t in toks:
+                key = key_prefix + t
+                idx = key_index.get(key)
+                if idx is None:
+                    idx = key_index[key] = len(out.keys)
+                    out.keys.append(key)
+                out.items.append(idx)
+            out.labels.append(1 if int(parts[0]) > 0 else 0)
+            out.offsets.append(len(out.items))
+    return out
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Typed record schemas for the JSONL manifests, with a validating decoder.
+
+Each manifest row type is a slots dataclass (on Python 3.10+), so loaded rows carry no
+per-instance __dict__. Decoding also checks every row against its schema:
+missing fields and wrong types fail at parse time with the file and line,
+instead of later as a KeyError or None in a training loop. Unknown extra
+fields are ignored, so older readers keep working on newer manifests.
+
+  PolyvoreOutfit / PolyvoreItem  polyvore_outfits[_with_images].jsonl
+  FitbQuestion                   polyvore_fitb.jsonl
+  CompatOutfit                   polyvore_compat.jsonl (ingest_polyvore.py --out-compat)
+  ItemImage                      polyvore_item_images.jsonl
+  ImageCheck                     image_status.jsonl (verify_images.py)
+  DeepFashionRecord              deep_fashion.jsonl
+  SopInteraction                 sop_interactions.jsonl
+
+When msgspec is installed, lines are decoded and validated straight into the
+dataclasses by msgspec. Otherwise they are parsed with the manifest_io backend
+and validated here.
+
+Usage:
+  from records import PolyvoreOutfit, iter_records
+  for o in iter_records(path, PolyvoreOutfit):
+      for it in o.items:
+          it.local_image_abspath
+
+Requires: Python 3.9+ (msgspec optional)
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import sys
+import types
+import typing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from manifest_io import get_backend
+
+_MISSING = dataclasses.MISSING
+
+# slots= needs Python 3.10; on 3.9 (stock macOS python3) records keep a __dict__.
+# Field annotations use Optional[...] rather than `X | None` for the same reason:
+# typing.get_type_hints evaluates them.
+_record = dataclass(slots=True) if sys.version_info >= (3, 10) else dataclass
+# `X | None` unions only exist as types.UnionType from 3.10.
+_UNION_TYPES = (typing.Union, getattr(types, "UnionType", typing.Union))
+
+
+@_record
+class PolyvoreItem:
+    item_uid: str
+    set_id: str
+    index: Optional[int]
+    categoryid: Optional[int]
+    name: Optional[str]
+    price: Optional[float]
+    likes: Optional[int]
+    image_url: Optional[str]
+    # Added by augment_polyvore_outfits_with_images.py when the image resolves.
+    local_image_relpath: Optional[str] = None
+    local_image_abspath: Optional[str] = None
+
+
+@_record
+class PolyvoreOutfit:
+    source: str
+    split: str
+    outfit_uid: str
+    set_id: str
+    set_url: Optional[str]
+    date: Optional[str]
+    desc: Optional[str]
+    items: list[PolyvoreItem]
+
+
+@_record
+class FitbQuestion:
+    source: str
+    question_id: list[str]
+    blank_position: Optional[int]
+    answers: list[str]
+    correct_answer: Optional[str]
+
+
+@_record
+class CompatOutfit:
+    source: str
+    label: int
+    item_uids: list[str]
+
+
+@_record
+class ItemImage:
+    item_uid: str
+    set_id: str
+    index: str
+    image_relpath: str
+    exists: bool
+    # Written by index_polyvore_images.py --stat.
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    # Written by verify_images.py --index-out.
+    width: Optional[int] = None
+    height: Optional[int] = None
+    status: Optional[str] = None
+
+
+@_record
+class ImageCheck:
+    path: str
+    status: str
+    mode: str
+    bytes: Optional[int]
+    mtime_ns: Optional[int]
+    width: Optional[int]
+    height: Optional[int]
+    error: Optional[str] = None
+
+
+@_record
+class DeepFashionItem:
+    category: str
+    style: str
+
+
+@_record
+class DeepFashionRecord:
+    source: str
+    outfit_uid: str
+    image_id: str
+    split: str
+    image_relpath: str
+    dataset_root: str
+    user_ids: list[str]
+    items: list[DeepFashionItem]
+    seasons: list[str]
+    occasions: list[str]
+    ratings: list[str]
+
+
+@_record
+class SopInteraction:
+    source: str
+    split: Optional[str]
+    file: str
+    user_id: Optional[str]
+    outfit_id: Optional[str]
+    matched: Optional[str]
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# --- stdlib validation -------------------------------------------------------
+
+
+def _checker(tp):
+    """Return fn(value, where) -> value that validates (and builds nested records)."""
+    origin = typing.get_origin(tp)
+    if origin in _UNION_TYPES:
+        args = typing.get_args(tp)
+        inner = [_checker(a) for a in args if a is not type(None)]
+        nullable = type(None) in args
+
+        def check_union(v, where):
+            if v is None and nullable:
+                return None
+            return inner[0](v, where)
+
+        return check_union
+    if origin is list:
+        (elem,) = typing.get_args(tp)
+        check_elem = _checker(elem)
+
+        def check_list(v, where):
+            if not isinstance(v, list):
+                raise SchemaError(f"{where}: expected array, got {type(v).__name__}")
+            return [check_elem(x, f"{where}[{i}]") for i, x in enumerate(v)]
+
+        return check_list
+    if dataclasses.is_dataclass(tp):
+        return lambda v, where: _build(tp, v, where)
+    if tp is float:
+        ok = (int, float)
+    elif tp is int:
+        ok = int
+    else:
+        ok = tp
+
+    def check_scalar(v, where):
+        # bool is an int subclass; do not let true/false pass as numbers.
+        if not isinstance(v, ok) or (isinstance(v, bool) and tp is not bool):
+            raise SchemaError(f"{where}: expected {tp.__name__}, got {type(v).__name__}")
+        return v
+
+    return check_scalar
+
+
+_SCHEMAS: dict[type, list] = {}
+
+
+def _schema(cls):
+    spec = _SCHEMAS.get(cls)
+    if spec is None:
+        hints = typing.get_type_hints(cls)
+        spec = [(f.name, _checker(hints[f.name]), f.default) for f in dataclasses.fields(cls)]
+        _SCHEMAS[cls] = spec
+    return spec
+
+
+def _build(cls, obj, where: str):
+    if not isinstance(obj, dict):
+        raise SchemaError(f"{where}: expected object for {cls.__name__}, got {type(obj).__name__}")
+    values = []
+    for name, check, default in _schema(cls):
+        if name in obj:
+            values.append(check(obj[name], f"{where}.{name}"))
+        elif default is not _MISSING:
+            values.append(default)
+        else:
+            raise SchemaError(f"{where}: {cls.__name__} is missing required field {name!r}")
+    return cls(*values)
+
+
+# --- decoding ----------------------------------------------------------------
+
+
+def _line_decoder(cls):
+    """fn(line_bytes, where) -> cls instance."""
+    try:
+        import msgspec
+    except ImportError:
+        loads = get_backend().loads
+
+        def decode(line, where):
+            try:
+                obj = loads(line)
+            except ValueError as e:
+                raise SchemaError(f"{where}: invalid JSON ({e})") from None
+            return _build(cls, obj, where)
+
+        return decode
+
+    decoder = msgspec.json.Decoder(cls)
+
+    def decode_msgspec(line, where):
+        try:
+            return decoder.decode(line)
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            raise SchemaError(f"{where}: {e}") from None
+
+    return decode_msgspec
+
+
+def decode_record(cls, line: bytes | str, where: str = "<record>"):
+    return _line_decoder(cls)(line, where)
+
+
+def iter_records(path: Path, cls, start: int = 0, end: int | None = None, with_raw: bool = False):
+    """Yield `cls` instances, one per non-blank line; SchemaError names the location on drift.
+
+    With a byte range, yields the lines that *start* in [start, end), so
+    adjacent ranges split a file between workers without overlap. Locations
+    are then reported as path@byte_offset.
+
+    With `with_raw`, yields (record, parsed dict) pairs instead, for rewriters
+    that must keep fields the schema does not declare (see `to_dict(rec, raw)`).
+    """
+    decode = _line_decoder(cls)
+    if with_raw:
+        loads = get_backend().loads
+        typed = decode
+
+        def decode(line, where):
+            return typed(line, where), loads(line)
+
+    with open(path, "rb", buffering=1 << 20) as f:
+        if start == 0 and end is None:
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    yield decode(line, f"{path}:{lineno}")
+            return
+        if start > 0:
+            # Skip the line straddling `start`; the previous range owns it.
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while end is None or pos < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield decode(line, f"{path}@{pos}")
+            pos += len(line)
+
+
+def read_records(path: Path, cls) -> list:
+    return list(iter_records(path, cls))
+
+
+def to_dict(rec, raw: dict | None = None) -> dict:
+    """Record -> plain dict in field order, for writing.
+
+    Fields still at their declared default are omitted (msgspec's omit_defaults),
+    so e.g. items without a resolved image do not gain local_image_* nulls.
+
+    `raw` is the row `rec` was decoded from. Its keys that the schema does not
+    declare are appended unchanged, also inside nested records, so rewriting a
+    manifest does not drop fields added by newer writers.
+    """
+    out = {}
+    for f in dataclasses.fields(rec):
+        v = getattr(rec, f.name)
+        if f.default is not _MISSING and v == f.default:
+            continue
+        sub = raw.get(f.name) if raw is not None else None
+        if isinstance(v, list):
+            subs = sub if isinstance(sub, list) and len(sub) == len(v) else [None] * len(v)
+            v = [
+                to_dict(x, r if isinstance(r, dict) else None) if dataclasses.is_dataclass(x) else x
+                for x, r in zip(v, subs)
+            ]
+        elif dataclasses.is_dataclass(v):
+            v = to_dict(v, sub if isinstance(sub, dict) else None)
+        out[f.name] = v
+    if raw is not None:
+        declared = {f.name for f in dataclasses.fields(rec)}
+        for k, v in raw.items():
+            if k not in declared:
+                out[k] = v
+    return out
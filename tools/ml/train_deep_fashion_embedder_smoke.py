@@ -16,17 +16,29 @@ Usage:
 Notes:
 - Requires: torch, torchvision, pillow
 - Does not write large checkpoints by default.
+- `--image-cache DIR` reads pre-resized images built by tools/ml/image_cache.py.
+- `--image-status REPORT` skips images that tools/ml/verify_images.py flagged as bad.
+- `--features DIR` trains only the fc head on features from tools/ml/extract_features.py.
+- `--manifest` may also be a .arrow/.parquet copy (ingest_deep_fashion.py --columnar):
+  categories are then counted with a column scan instead of parsing every record.
+- Data loading flags (--num-workers, --pin-memory, ...) come from tools/ml/data_loading.py.
 """
 
 from __future__ import annotations
 
 import argparse
-import json
 import random
 from collections import Counter
 from dataclasses import dataclass
 from pathlib import Path
 
+from data_loading import ThroughputMeter, add_loader_args, bench_loader, imagenet_transform, make_loader
+from extract_features import FeatureStore
+from image_cache import ImageCache
+from manifest_columnar import is_columnar, list_field, read_table
+from records import DeepFashionRecord, iter_records
+from verify_images import load_bad_paths
+
 
 def _choose_device() -> str:
     import torch
@@ -44,10 +56,122 @@ class Sample:
     label: int
 
 
+class SampleDataset:
+    """Worker-safe image classification dataset; the transform is built per process.
+
+    With an ImageCache (keyed by absolute image path), cached images are read
+    from its memory map instead of decoding the JPEG.
+    """
+
+    def __init__(self, samples: list[Sample], cache: ImageCache | None = None):
+        self.samples = samples
+        self.cache = cache
+        self._tfm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tfm"] = None
+        return state
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        import torch
+        from PIL import Image
+
+        s = self.samples[idx]
+        key = str(s.image_path)
+        if self.cache is not None and key in self.cache:
+            x = self.cache.tensor(key)
+        else:
+            if self._tfm is None:
+                self._tfm = imagenet_transform()
+            img = Image.open(s.image_path).convert("RGB")
+            x = self._tfm(img)
+        y = torch.tensor(s.label, dtype=torch.long)
+        return x, y
+
+
+def _train_fc_on_features(store: FeatureStore, samples: list[Sample], num_classes: int, args: argparse.Namespace) -> int:
+    """Train only the classifier head on precomputed backbone features."""
+    import numpy as np
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+
+    device = _choose_device()
+    print(f"Using device: {device}")
+    print(f"Training fc on features: dim={store.dim} backbone={store.backbone}")
+
+    rows = store.rows_for([str(s.image_path) for s in samples])
+    x_all = torch.from_numpy(np.asarray(store.matrix()[rows], dtype=np.float32)).to(device)
+    y_all = torch.tensor([s.label for s in samples], dtype=torch.long, device=device)
+
+    fc = nn.Linear(store.dim, num_classes).to(device)
+    opt = optim.Adam(fc.parameters(), lr=1e-3)
+    loss_fn = nn.CrossEntropyLoss()
+
+    fc.train()
+    n = len(samples)
+    for epoch in range(args.epochs):
+        total = 0.0
+        correct = 0
+        perm = torch.randperm(n, device=device)
+        for start in range(0, n, args.head_batch_size):
+            sel = perm[start : start + args.head_batch_size]
+            xb, yb = x_all[sel], y_all[sel]
+
+            opt.zero_grad(set_to_none=True)
+            logits = fc(xb)
+            loss = loss_fn(logits, yb)
+            loss.backward()
+            opt.step()
+
+            total += float(loss.item()) * int(xb.size(0))
+            correct += int((logits.argmax(dim=1) == yb).sum().item())
+
+        print(f"epoch={epoch+1} loss={total/n:.4f} acc={correct/n:.3f}")
+
+    print("Smoke train (fc on features) complete.")
+    return 0
+
+
+def _labelled_rows(manifest_path: Path, split: str, top_k: int) -> tuple[Counter, list[tuple[str, str]]]:
+    """First-item category counts, plus (category, image path) for rows in the top_k categories."""
+    if is_columnar(manifest_path):
+        import numpy as np
+        import pyarrow.compute as pc
+
+        t = read_table(manifest_path, ["dataset_root", "image_relpath", "items"], ("split", split) if split else None)
+        offsets, cats = list_field(t, "items", "category")
+        has_items = np.flatnonzero(offsets[1:] > offsets[:-1])
+        first = pc.utf8_trim_whitespace(cats.take(offsets[:-1][has_items]))
+        counts = pc.value_counts(first).to_pylist()
+        cat_counter = Counter({c["values"]: c["counts"] for c in counts if c["values"]})
+        top = [c for c, _ in cat_counter.most_common(top_k)]
+        keep = np.asarray(pc.is_in(first, value_set=pc.cast(top, first.type)).to_numpy(zero_copy_only=False))
+        rows = has_items[keep]
+        roots = t["dataset_root"].take(rows).to_pylist()
+        rels = t["image_relpath"].take(rows).to_pylist()
+        labelled = [(c, str(Path(r) / rel)) for c, r, rel in zip(first.filter(keep).to_pylist(), roots, rels)]
+        return cat_counter, labelled
+
+    rows = [
+        (r.items[0].category.strip(), str(Path(r.dataset_root) / r.image_relpath))
+        for r in iter_records(manifest_path, DeepFashionRecord)
+        if r.items and (not split or r.split == split)
+    ]
+    cat_counter = Counter(c for c, _ in rows if c)
+    top = {c for c, _ in cat_counter.most_common(top_k)}
+    return cat_counter, [(c, p) for c, p in rows if c in top]
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--manifest", required=True)
     ap.add_argument("--max-samples", type=int, default=256)
+    ap.add_argument("--split", default="", help="Only use records of this split (train/val/test)")
     ap.add_argument("--epochs", type=int, default=1)
     ap.add_argument(
         "--pretrained",
@@ -55,48 +179,40 @@ def main() -> int:
         help="Use torchvision pretrained weights (may require network access).",
     )
     ap.add_argument("--seed", type=int, default=1337)
+    ap.add_argument("--image-cache", default="", help="Pre-resized cache dir from tools/ml/image_cache.py")
+    ap.add_argument("--image-status", default="", help="Report from tools/ml/verify_images.py; skip bad images")
+    ap.add_argument(
+        "--features",
+        default="",
+        help="Feature dir from tools/ml/extract_features.py; trains only the fc head on it",
+    )
+    ap.add_argument("--head-batch-size", type=int, default=256, help="--features: samples per step")
+    add_loader_args(ap)
     args = ap.parse_args()
 
     random.seed(args.seed)
 
-    manifest_path = Path(args.manifest).expanduser().resolve()
-    rows = []
-    with manifest_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            rows.append(json.loads(line))
-
-    # Build label space from most common categories.
-    cat_counter = Counter()
-    for r in rows:
-        items = r.get("items") or []
-        if not items:
-            continue
-        cat = (items[0].get("category") or "").strip()
-        if cat:
-            cat_counter[cat] += 1
+    cache = ImageCache(Path(args.image_cache).expanduser().resolve()) if args.image_cache else None
+    store = FeatureStore(Path(args.features).expanduser().resolve()) if args.features else None
+    bad = load_bad_paths(Path(args.image_status).expanduser().resolve()) if args.image_status else set()
 
+    manifest_path = Path(args.manifest).expanduser().resolve()
+    # Build label space from most common categories (first item category);
+    # keep a manageable number of classes for the smoke run.
+    cat_counter, labelled = _labelled_rows(manifest_path, args.split, 12)
     if not cat_counter:
         raise SystemExit("No categories found in manifest")
 
-    # Keep a manageable number of classes for the smoke run.
     top_cats = [c for c, _ in cat_counter.most_common(12)]
     cat_to_idx = {c: i for i, c in enumerate(top_cats)}
 
     samples: list[Sample] = []
-    for r in rows:
-        items = r.get("items") or []
-        if not items:
-            continue
-        cat = (items[0].get("category") or "").strip()
-        if cat not in cat_to_idx:
-            continue
-        dataset_root = Path(r["dataset_root"])
-        image_relpath = r["image_relpath"]
-        p = dataset_root / image_relpath
-        if not p.exists():
+    for cat, path in labelled:
+        p = Path(path)
+        if store is not None:
+            if str(p) not in store:
+                continue
+        elif path in bad or not ((cache is not None and str(p) in cache) or p.exists()):
             continue
         samples.append(Sample(image_path=p, label=cat_to_idx[cat]))
 
@@ -108,40 +224,22 @@ def main() -> int:
     for c in top_cats:
         print(f"  - {c}: {cat_counter[c]}")
 
+    if store is not None:
+        return _train_fc_on_features(store, samples, len(cat_to_idx), args)
+
     # Torch bits
     import torch
     import torch.nn as nn
     import torch.optim as optim
-    from PIL import Image
-    from torchvision import models, transforms
+    from torchvision import models
 
     device = _choose_device()
     print(f"Using device: {device}")
 
-    tfm = transforms.Compose(
-        [
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ]
-    )
-
-    class DS(torch.utils.data.Dataset):
-        def __init__(self, samples: list[Sample]):
-            self.samples = samples
-
-        def __len__(self):
-            return len(self.samples)
-
-        def __getitem__(self, idx):
-            s = self.samples[idx]
-            img = Image.open(s.image_path).convert("RGB")
-            x = tfm(img)
-            y = torch.tensor(s.label, dtype=torch.long)
-            return x, y
-
-    ds = DS(samples)
-    dl = torch.utils.data.DataLoader(ds, batch_size=16, shuffle=True, num_workers=0)
+    ds = SampleDataset(samples, cache)
+    dl = make_loader(ds, args, device=device, batch_size=16, shuffle=True)
+    if args.bench_loader:
+        return bench_loader(dl, args.bench_loader)
 
     # Small model: resnet18 head. Default to random init to avoid network downloads.
     weights = models.ResNet18_Weights.DEFAULT if args.pretrained else None
@@ -153,11 +251,12 @@ def main() -> int:
     loss_fn = nn.CrossEntropyLoss()
 
     model.train()
+    meter = ThroughputMeter()
     for epoch in range(args.epochs):
         total = 0.0
         correct = 0
         seen = 0
-        for xb, yb in dl:
+        for xb, yb in meter.wrap(dl):
             xb = xb.to(device)
             yb = yb.to(device)
 
@@ -171,9 +270,11 @@ def main() -> int:
             pred = logits.argmax(dim=1)
             correct += int((pred == yb).sum().item())
             seen += int(xb.size(0))
+            meter.step(int(xb.size(0)))
 
         print(f"epoch={epoch+1} loss={total/seen:.4f} acc={correct/seen:.3f}")
 
+    print(meter.summary())
     print("Smoke train complete.")
     return 0
 
@@ -15,16 +15,39 @@ Usage:
     --max-images 200 \
     --steps 50
 
+For the full train split, convert with `--columnar` and pass
+`--columnar tools/_out/deepfashion2_coco/instances_train_columnar` instead of
+`--coco`: boxes/labels are memory-mapped and sliced per image, so there is no
+JSON parse at startup.
+
+To train without extracting the archive, pass `--df2-zip .../train.zip`
+(plus --password or $DEEPFASHION2_ZIP_PASSWORD) instead of `--df2-root`.
+Image bytes are then read straight from the zip via the persisted entry
+index from tools/ml/zip_entries.py: a binary search plus one pread for stored
+entries, and a per-worker pyzipper handle for encrypted ones. Each
+DataLoader worker opens its own handles.
+
+`--image-status REPORT` (tools/ml/verify_images.py --dir <df2>/<split>/image)
+drops images that failed verification before sampling.
+
+Data loading flags (--num-workers, --pin-memory, --persistent-workers,
+--prefetch-factor, --bench-loader) come from tools/ml/data_loading.py.
+
 Requires: torch, torchvision, pillow
 """
 
 from __future__ import annotations
 
 import argparse
+import io
 import json
 import random
 from pathlib import Path
 
+from data_loading import ThroughputMeter, add_loader_args, bench_loader, make_loader
+from verify_images import load_bad_paths
+from zip_entries import ZipEntryIndex, zip_password
+
 
 def _choose_device() -> str:
     import torch
@@ -41,37 +64,187 @@ def _load_coco(coco_path: Path) -> dict:
         return json.load(f)
 
 
+_COLUMNAR_FIELDS = (
+    "image_ids",
+    "file_names",
+    "ann_offsets",
+    "boxes",
+    "category_ids",
+    "areas",
+    "categories",
+)
+
+
+def _load_columnar(columnar_dir: Path) -> dict:
+    """Memory-map the sidecar written by convert_deepfashion2_to_coco.py --columnar."""
+    import numpy as np
+
+    return {name: np.load(columnar_dir / f"{name}.npy", mmap_mode="r") for name in _COLUMNAR_FIELDS}
+
+
+def _columns_from_coco(coco: dict) -> dict:
+    """Build the same per-image offset layout as the sidecar from a COCO dict."""
+    import numpy as np
+
+    images = coco.get("images") or []
+    imgid_to_anns: dict[int, list[dict]] = {}
+    for a in coco.get("annotations") or []:
+        imgid_to_anns.setdefault(int(a["image_id"]), []).append(a)
+
+    offsets = [0]
+    boxes: list[list[float]] = []
+    category_ids: list[int] = []
+    areas: list[float] = []
+    for im in images:
+        for a in imgid_to_anns.get(int(im["id"]), []):
+            x, y, w, h = a["bbox"]
+            boxes.append([x, y, w, h])
+            category_ids.append(int(a["category_id"]))
+            areas.append(float(a.get("area", w * h)))
+        offsets.append(len(category_ids))
+
+    return {
+        "image_ids": np.array([int(im["id"]) for im in images], dtype=np.int64),
+        "file_names": np.array([im["file_name"].encode("utf-8") for im in images]),
+        "ann_offsets": np.array(offsets, dtype=np.int64),
+        "boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        "category_ids": np.array(category_ids, dtype=np.int32),
+        "areas": np.array(areas, dtype=np.float32),
+        "categories": np.array(sorted({int(c["id"]) for c in coco.get("categories") or []}), dtype=np.int32),
+    }
+
+
+class DF2DetectionDataset:
+    """DF2 images + targets read from the column layout.
+
+    Worker-safe: holds paths, row indices and a small label lookup table. When
+    backed by a columnar sidecar, each worker re-opens its own memory maps
+    instead of receiving pickled copies of the arrays. With `zip_index`,
+    `images_dir` is the entry prefix inside the archive (e.g. "train/image") and
+    each worker reads through its own archive handle.
+    """
+
+    def __init__(
+        self,
+        images_dir: Path | str,
+        rows: list[int],
+        contig_lut,
+        cols: dict,
+        columnar_dir: Path | None = None,
+        zip_index: ZipEntryIndex | None = None,
+    ):
+        self.images_dir = images_dir
+        self.zip_index = zip_index
+        self.rows = rows
+        self.contig_lut = contig_lut
+        self.columnar_dir = columnar_dir
+        self._cols = cols
+        self._tfm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tfm"] = None
+        if self.columnar_dir is not None:
+            state["_cols"] = None
+        return state
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        import numpy as np
+        import torch
+        from PIL import Image
+
+        if self._cols is None:
+            self._cols = _load_columnar(self.columnar_dir)
+        if self._tfm is None:
+            from torchvision import transforms
+
+            self._tfm = transforms.Compose([
+                transforms.ToTensor(),
+            ])
+        cols = self._cols
+
+        row = self.rows[idx]
+        img_id = int(cols["image_ids"][row])
+        name = cols["file_names"][row].decode("utf-8")
+        if self.zip_index is not None:
+            fp = io.BytesIO(self.zip_index.read(f"{self.images_dir}/{name}"))
+        else:
+            fp = self.images_dir / name
+        img = self._tfm(Image.open(fp).convert("RGB"))
+
+        # Zero-copy slices of the (possibly memory-mapped) columns.
+        start, end = int(cols["ann_offsets"][row]), int(cols["ann_offsets"][row + 1])
+        xywh = cols["boxes"][start:end]
+        keep = (xywh[:, 2] > 1) & (xywh[:, 3] > 1)
+        xywh = xywh[keep]
+        boxes = np.concatenate([xywh[:, :2], xywh[:, :2] + xywh[:, 2:]], axis=1)
+        labels = self.contig_lut[cols["category_ids"][start:end][keep]]
+        areas = cols["areas"][start:end][keep]
+
+        target = {
+            "boxes": torch.tensor(boxes, dtype=torch.float32).reshape(-1, 4),
+            "labels": torch.tensor(labels, dtype=torch.int64),
+            "image_id": torch.tensor([img_id], dtype=torch.int64),
+            "area": torch.tensor(areas, dtype=torch.float32),
+            "iscrowd": torch.zeros((len(boxes),), dtype=torch.int64),
+        }
+        return img, target
+
+
+def _collate(batch):
+    imgs, targets = zip(*batch)
+    return list(imgs), list(targets)
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--df2-root", required=True)
-    ap.add_argument("--coco", required=True)
+    images = ap.add_mutually_exclusive_group(required=True)
+    images.add_argument("--df2-root", help="Extracted DeepFashion2 tree")
+    images.add_argument("--df2-zip", help="Read images straight from this archive (e.g. train.zip)")
+    ap.add_argument("--password", default="", help="--df2-zip password (default: $DEEPFASHION2_ZIP_PASSWORD or prompt)")
+    ap.add_argument("--zip-index", default="", help="--df2-zip entry index dir (default: <zip>.entries next to it)")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--coco", help="COCO instances JSON")
+    src.add_argument("--columnar", help="Columnar sidecar dir from convert_deepfashion2_to_coco.py --columnar")
     ap.add_argument("--split", required=True, choices=["train", "validation"])
     ap.add_argument("--max-images", type=int, default=200)
     ap.add_argument("--steps", type=int, default=50)
     ap.add_argument("--seed", type=int, default=1337)
+    ap.add_argument("--image-status", default="", help="Report from tools/ml/verify_images.py; skip bad images")
+    add_loader_args(ap)
     args = ap.parse_args()
 
     random.seed(args.seed)
 
-    df2_root = Path(args.df2_root).expanduser().resolve()
-    images_dir = df2_root / args.split / "image"
-    coco_path = Path(args.coco).expanduser().resolve()
-
-    coco = _load_coco(coco_path)
-    images = coco.get("images") or []
-    anns = coco.get("annotations") or []
-    cats = coco.get("categories") or []
-
-    if not images:
+    zip_index = None
+    if args.df2_zip:
+        if args.image_status:
+            raise SystemExit(
+                "--image-status applies to extracted images; check archives with tools/deepfashion2/check_deepfashion2_zips.py"
+            )
+        zip_path = Path(args.df2_zip).expanduser().resolve()
+        index_dir = Path(args.zip_index).expanduser().resolve() if args.zip_index else None
+        zip_index = ZipEntryIndex(zip_path, zip_password(args.password), index_dir)
+        images_dir = f"{args.split}/image"
+    else:
+        df2_root = Path(args.df2_root).expanduser().resolve()
+        images_dir = df2_root / args.split / "image"
+
+    columnar_dir = Path(args.columnar).expanduser().resolve() if args.columnar else None
+    if columnar_dir is not None:
+        cols = _load_columnar(columnar_dir)
+    else:
+        cols = _columns_from_coco(_load_coco(Path(args.coco).expanduser().resolve()))
+
+    num_images = len(cols["image_ids"])
+    if not num_images:
         raise SystemExit("COCO has no images")
 
-    # Build image_id -> annotations
-    imgid_to_anns: dict[int, list[dict]] = {}
-    for a in anns:
-        imgid_to_anns.setdefault(int(a["image_id"]), []).append(a)
-
     # Determine class id mapping (COCO category_id can be non-contiguous)
-    cat_ids = sorted({int(c["id"]) for c in cats})
+    cat_ids = sorted(int(c) for c in cols["categories"])
     if not cat_ids:
         raise SystemExit("COCO has no categories")
 
@@ -79,63 +252,32 @@ def main() -> int:
     cat_to_contig = {cid: i + 1 for i, cid in enumerate(cat_ids)}
     num_classes = 1 + len(cat_ids)
 
+    import numpy as np
     import torch
-    from PIL import Image
-    from torchvision import transforms
     from torchvision.models.detection import fasterrcnn_mobilenet_v3_large_fpn
 
     device = _choose_device()
     print(f"Using device: {device}")
     print(f"num_classes (incl bg): {num_classes}")
 
-    tfm = transforms.Compose([
-        transforms.ToTensor(),
-    ])
-
-    # Sample a subset for smoke
-    subset = images[:]
+    # Lookup table: DF2 category id -> contiguous label.
+    contig_lut = np.zeros(max(cat_ids) + 1, dtype=np.int64)
+    for cid, label in cat_to_contig.items():
+        contig_lut[cid] = label
+
+    # Sample a subset for smoke (row indices into the columns)
+    subset = list(range(num_images))
+    if args.image_status:
+        bad = load_bad_paths(Path(args.image_status).expanduser().resolve())
+        subset = [r for r in subset if str(images_dir / cols["file_names"][r].decode("utf-8")) not in bad]
+        print(f"Images after --image-status filter: {len(subset)}/{num_images}")
     random.shuffle(subset)
     subset = subset[: min(len(subset), args.max_images)]
 
-    class DS(torch.utils.data.Dataset):
-        def __init__(self, subset_images: list[dict]):
-            self.images = subset_images
-
-        def __len__(self):
-            return len(self.images)
-
-        def __getitem__(self, idx):
-            im = self.images[idx]
-            img_id = int(im["id"])
-            fp = images_dir / im["file_name"]
-            img = tfm(Image.open(fp).convert("RGB"))
-
-            ann_list = imgid_to_anns.get(img_id, [])
-            boxes = []
-            labels = []
-            areas = []
-            for a in ann_list:
-                x, y, w, h = a["bbox"]
-                if w <= 1 or h <= 1:
-                    continue
-                boxes.append([x, y, x + w, y + h])
-                labels.append(cat_to_contig[int(a["category_id"])])
-                areas.append(float(a.get("area", w * h)))
-
-            target = {
-                "boxes": torch.tensor(boxes, dtype=torch.float32),
-                "labels": torch.tensor(labels, dtype=torch.int64),
-                "image_id": torch.tensor([img_id], dtype=torch.int64),
-                "area": torch.tensor(areas, dtype=torch.float32) if areas else torch.zeros((0,), dtype=torch.float32),
-                "iscrowd": torch.zeros((len(boxes),), dtype=torch.int64),
-            }
-            return img, target
-
-    def collate(batch):
-        imgs, targets = zip(*batch)
-        return list(imgs), list(targets)
-
-    dl = torch.utils.data.DataLoader(DS(subset), batch_size=2, shuffle=True, num_workers=0, collate_fn=collate)
+    ds = DF2DetectionDataset(images_dir, subset, contig_lut, cols, columnar_dir, zip_index)
+    dl = make_loader(ds, args, device=device, batch_size=2, shuffle=True, collate_fn=_collate)
+    if args.bench_loader:
+        return bench_loader(dl, args.bench_loader)
 
     model = fasterrcnn_mobilenet_v3_large_fpn(weights=None, weights_backbone=None, num_classes=num_classes)
     model.to(device)
@@ -144,9 +286,10 @@ def main() -> int:
     opt = torch.optim.SGD(params, lr=0.005, momentum=0.9, weight_decay=0.0005)
 
     model.train()
+    meter = ThroughputMeter()
     step = 0
     for epoch in range(10_000):
-        for imgs, targets in dl:
+        for imgs, targets in meter.wrap(dl):
             imgs = [im.to(device) for im in imgs]
             targets = [{k: v.to(device) for k, v in t.items()} for t in targets]
 
@@ -156,12 +299,14 @@ def main() -> int:
             opt.zero_grad(set_to_none=True)
             loss.backward()
             opt.step()
+            meter.step(len(imgs))
 
             step += 1
             if step % 10 == 0:
                 ld = {k: float(v.detach().cpu().item()) for k, v in loss_dict.items()}
                 print(f"step={step} loss={float(loss.detach().cpu().item()):.4f} parts={ld}")
             if step >= args.steps:
+                print(meter.summary())
                 print("DeepFashion2 detector smoke train complete.")
                 return 0
 
@@ -17,17 +17,46 @@ Usage:
     --pairs 4000 \
     --epochs 1
 
+`--mode items` samples a batch of outfits, runs the backbone once per unique
+item and scores pairs gathered from the embedding matrix (all same-outfit pairs
+plus in-batch cross-outfit negatives), instead of two backbone passes per pair.
+
+For head experiments, precompute backbone features once with
+tools/ml/extract_features.py and pass `--features DIR`: only `proj`/`head`
+are trained, on feature rows, with no image decoding or backbone passes.
+
+`--export-embeddings DIR` writes the trained 256-d `proj` embedding of every
+catalogue item (FeatureStore layout, keyed by item_uid) for serving with
+tools/ml/item_index.py.
+
+`--outfits` may also be a .arrow/.parquet copy written with --columnar; only
+the item uid/path columns are read.
+
+Build a pre-resized cache once with tools/ml/image_cache.py and pass
+`--image-cache DIR` to read items from it instead of decoding JPEGs.
+
+`--image-status REPORT` (from tools/ml/verify_images.py) drops items whose
+image failed verification before any samples are built.
+
+Data loading flags (--num-workers, --pin-memory, ...) come from tools/ml/data_loading.py.
+
 Requires: torch, torchvision, pillow
 """
 
 from __future__ import annotations
 
 import argparse
-import json
 import random
 from dataclasses import dataclass
 from pathlib import Path
 
+from data_loading import ThroughputMeter, add_loader_args, bench_loader, imagenet_transform, make_loader
+from extract_features import FeatureStore, KeyedImageDataset, save_feature_store
+from image_cache import ImageCache, collect_image_keys
+from manifest_columnar import is_columnar, list_field, read_table
+from records import PolyvoreOutfit, iter_records
+from verify_images import load_bad_paths
+
 
 def _choose_device() -> str:
     import torch
@@ -39,13 +68,251 @@ def _choose_device() -> str:
     return "cpu"
 
 
+@dataclass
+class Item:
+    uid: str
+    path: Path
+
+
 @dataclass
 class Pair:
-    a: Path
-    b: Path
+    a: Item
+    b: Item
     y: int
 
 
+class _ItemImages:
+    """Shared item loading for the datasets below.
+
+    Worker-safe: the transform is built per process. With an ImageCache, items
+    present in the cache are read from its memory map instead of decoding the JPEG.
+    """
+
+    def __init__(self, cache: ImageCache | None = None):
+        self.cache = cache
+        self._tfm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tfm"] = None
+        return state
+
+    def _load(self, item: Item):
+        from PIL import Image
+
+        if self.cache is not None and item.uid in self.cache:
+            return self.cache.tensor(item.uid)
+        if self._tfm is None:
+            self._tfm = imagenet_transform()
+        return self._tfm(Image.open(item.path).convert("RGB"))
+
+
+class PairDataset(_ItemImages):
+    def __init__(self, pairs: list[Pair], cache: ImageCache | None = None):
+        super().__init__(cache)
+        self.pairs = pairs
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, idx):
+        import torch
+
+        p = self.pairs[idx]
+        xa = self._load(p.a)
+        xb = self._load(p.b)
+        y = torch.tensor([p.y], dtype=torch.float32)
+        return xa, xb, y
+
+
+class OutfitItemsDataset(_ItemImages):
+    """One sample = up to `items_per_outfit` distinct items of one outfit.
+
+    Used by `--mode items`: a batch of outfits is embedded once per unique item
+    and pairs are formed inside the batch.
+    """
+
+    def __init__(self, outfits: list[list[Item]], items_per_outfit: int, cache: ImageCache | None = None):
+        super().__init__(cache)
+        self.outfits = outfits
+        self.items_per_outfit = items_per_outfit
+
+    def __len__(self):
+        return len(self.outfits)
+
+    def __getitem__(self, idx):
+        import torch
+
+        items = self.outfits[idx]
+        chosen = random.sample(items, min(len(items), self.items_per_outfit))
+        return torch.stack([self._load(it) for it in chosen]), idx
+
+
+def _collate_outfits(batch):
+    import torch
+
+    xs, owners = [], []
+    for x, idx in batch:
+        xs.append(x)
+        owners.append(torch.full((x.size(0),), idx, dtype=torch.int64))
+    return torch.cat(xs), torch.cat(owners)
+
+
+def _iter_outfit_items(outfits_path: Path):
+    """Yield [(item_uid, local_image_abspath or None), ...] per outfit, from JSONL or a columnar copy."""
+    if is_columnar(outfits_path):
+        t = read_table(outfits_path, ["items"])
+        offsets, uids = list_field(t, "items", "item_uid")
+        _, paths = list_field(t, "items", "local_image_abspath")
+        uids, paths = uids.to_pylist(), paths.to_pylist()
+        for a, b in zip(offsets[:-1], offsets[1:]):
+            yield list(zip(uids[a:b], paths[a:b]))
+        return
+    for o in iter_records(outfits_path, PolyvoreOutfit):
+        yield [(it.item_uid, it.local_image_abspath) for it in o.items]
+
+
+def _in_batch_pairs(owner, neg_per_pos: int):
+    """Index pairs (i < j) over a batch of item embeddings.
+
+    All same-outfit pairs are positives; negatives are a random subset of the
+    cross-outfit pairs, `neg_per_pos` per positive.
+    """
+    import torch
+
+    n = owner.numel()
+    ii, jj = torch.triu_indices(n, n, offset=1)
+    same = owner[ii] == owner[jj]
+    pos = same.nonzero().squeeze(1)
+    neg = (~same).nonzero().squeeze(1)
+    k = min(neg.numel(), pos.numel() * neg_per_pos)
+    neg = neg[torch.randperm(neg.numel())[:k]]
+    sel = torch.cat([pos, neg])
+    return ii[sel], jj[sel], same[sel].to(torch.float32).unsqueeze(1)
+
+
+def _build_heads(in_dim: int, embed_dim: int = 256):
+    """Projection (backbone features -> item embedding) and pair classifier."""
+    import torch.nn as nn
+
+    proj = nn.Sequential(
+        nn.Linear(in_dim, embed_dim),
+        nn.ReLU(),
+        nn.Linear(embed_dim, embed_dim),
+    )
+
+    head = nn.Sequential(
+        nn.Linear(embed_dim * 2, 128),
+        nn.ReLU(),
+        nn.Linear(128, 1),
+    )
+    return proj, head
+
+
+def _export_embeddings(
+    out_dir: Path,
+    outfits_path: Path,
+    proj,
+    head,
+    backbone,
+    store: FeatureStore | None,
+    cache: ImageCache | None,
+    args: argparse.Namespace,
+    device: str,
+    bad: frozenset[str] | set[str] = frozenset(),
+) -> None:
+    """Write `proj` embeddings for every resolvable catalogue item (not just the
+    sampled outfits) in FeatureStore layout, keyed by item_uid, plus the pair
+    head's weights as head.pt (used by tools/ml/eval_fitb.py --scorer head)."""
+    import numpy as np
+    import torch
+
+    uid_to_path = {u: p for u, p in collect_image_keys(outfits_path, None).items() if p not in bad}
+    if store is not None:
+        uids = [u for u in uid_to_path if u in store]
+    else:
+        uids = [u for u, p in uid_to_path.items() if (cache is not None and u in cache) or Path(p).exists()]
+    out = np.zeros((len(uids), proj[-1].out_features), dtype=np.float32)
+
+    proj.eval()
+    with torch.inference_mode():
+        if store is not None:
+            rows = store.rows_for(uids)
+            for start in range(0, len(uids), 4096):
+                x = np.asarray(store.matrix()[rows[start : start + 4096]], dtype=np.float32)
+                out[start : start + len(x)] = proj(torch.from_numpy(x).to(device)).cpu().numpy()
+        else:
+            backbone.eval()
+            ds = KeyedImageDataset(uids, [uid_to_path[u] for u in uids], cache)
+            for x, idx, _ok in make_loader(ds, args, device=device, batch_size=64, shuffle=False):
+                out[idx.numpy()] = proj(backbone(x.to(device))).cpu().numpy()
+
+    save_feature_store(out_dir, uids, out, "pairwise-proj")
+    torch.save(head.state_dict(), out_dir / "head.pt")
+    print(f"Exported embeddings: {len(uids)} x {out.shape[1]} -> {out_dir}")
+
+
+def _train_heads_on_features(store: FeatureStore, pairs: list[Pair], args: argparse.Namespace, device: str) -> int:
+    """Train only proj/head on precomputed backbone features (no images, no backbone)."""
+    import numpy as np
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+
+    # Gather just the rows these pairs touch into one small float32 matrix.
+    uids = sorted({p.a.uid for p in pairs} | {p.b.uid for p in pairs})
+    local = {u: i for i, u in enumerate(uids)}
+    feats = torch.from_numpy(np.asarray(store.matrix()[store.rows_for(uids)], dtype=np.float32)).to(device)
+    ia = torch.tensor([local[p.a.uid] for p in pairs], dtype=torch.int64)
+    ib = torch.tensor([local[p.b.uid] for p in pairs], dtype=torch.int64)
+    ys = torch.tensor([[p.y] for p in pairs], dtype=torch.float32)
+    print(f"Training heads on features: dim={store.dim} items={len(uids)} backbone={store.backbone}")
+
+    proj, head = _build_heads(store.dim)
+    model = nn.Sequential(proj, head).to(device)
+    opt = optim.Adam(model.parameters(), lr=1e-3)
+    loss_fn = nn.BCEWithLogitsLoss()
+
+    for epoch in range(args.epochs):
+        model.train()
+        total_loss = 0.0
+        correct = 0
+        perm = torch.randperm(len(pairs))
+        for start in range(0, len(pairs), args.head_batch_size):
+            sel = perm[start : start + args.head_batch_size]
+            ea = proj(feats[ia[sel].to(device)])
+            eb = proj(feats[ib[sel].to(device)])
+            logits = head(torch.cat([ea, eb], dim=1))
+            y = ys[sel].to(device)
+
+            opt.zero_grad(set_to_none=True)
+            loss = loss_fn(logits, y)
+            loss.backward()
+            opt.step()
+
+            total_loss += float(loss.item()) * int(y.size(0))
+            pred = (torch.sigmoid(logits) >= 0.5).to(torch.float32)
+            correct += int((pred == y).sum().item())
+
+        print(f"epoch={epoch+1} loss={total_loss/len(pairs):.4f} acc={correct/len(pairs):.3f}")
+
+    if args.export_embeddings:
+        _export_embeddings(
+            Path(args.export_embeddings).expanduser().resolve(),
+            Path(args.outfits).expanduser().resolve(),
+            proj,
+            head,
+            None,
+            store,
+            None,
+            args,
+            device,
+        )
+
+    print("Polyvore pairwise head training on features complete.")
+    return 0
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--outfits", required=True)
@@ -53,139 +320,180 @@ def main() -> int:
     ap.add_argument("--pairs", type=int, default=4000)
     ap.add_argument("--epochs", type=int, default=1)
     ap.add_argument("--seed", type=int, default=1337)
+    ap.add_argument("--image-cache", default="", help="Pre-resized cache dir from tools/ml/image_cache.py")
+    ap.add_argument("--image-status", default="", help="Report from tools/ml/verify_images.py; skip bad images")
+    ap.add_argument(
+        "--mode",
+        choices=["pairs", "items"],
+        default="pairs",
+        help="pairs: two backbone passes per sampled pair; items: embed each item once per batch, pair in-batch",
+    )
+    ap.add_argument("--outfits-per-batch", type=int, default=8, help="--mode items: outfits per step")
+    ap.add_argument("--items-per-outfit", type=int, default=4, help="--mode items: items sampled per outfit")
+    ap.add_argument("--neg-per-pos", type=int, default=1, help="--mode items: negatives per positive pair")
+    ap.add_argument(
+        "--features",
+        default="",
+        help="Feature dir from tools/ml/extract_features.py; trains only proj/head on it (pairs mode)",
+    )
+    ap.add_argument("--head-batch-size", type=int, default=256, help="--features: pairs per step")
+    ap.add_argument(
+        "--export-embeddings",
+        default="",
+        help="After training, write proj embeddings of all catalogue items here (input for tools/ml/item_index.py)",
+    )
+    add_loader_args(ap)
     args = ap.parse_args()
 
     random.seed(args.seed)
 
+    if args.features and args.mode == "items":
+        raise SystemExit("--features trains heads on sampled pairs; use --mode pairs")
+
+    cache = ImageCache(Path(args.image_cache).expanduser().resolve()) if args.image_cache else None
+    store = FeatureStore(Path(args.features).expanduser().resolve()) if args.features else None
+    bad = load_bad_paths(Path(args.image_status).expanduser().resolve()) if args.image_status else set()
+
     outfits_path = Path(args.outfits).expanduser().resolve()
-    outfits = []
-    with outfits_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
+    outfits: list[list[Item]] = []
+    for outfit_items in _iter_outfit_items(outfits_path):
+        # Use only items with resolved local image (cached items skip the stat).
+        # With --features, an item only needs a feature row.
+        resolved = []
+        for uid, p in outfit_items:
+            if store is not None:
+                if uid in store:
+                    resolved.append(Item(uid=uid, path=Path(p or "")))
+                continue
+            if not p or p in bad:
                 continue
-            o = json.loads(line)
-            items = o.get("items") or []
-            # Use only items with resolved local image.
-            paths = []
-            for it in items:
-                p = it.get("local_image_abspath")
-                if p and Path(p).exists():
-                    paths.append(Path(p))
-            if len(paths) >= 2:
-                outfits.append(paths)
-            if len(outfits) >= args.max_outfits:
-                break
+            if (cache is not None and uid in cache) or Path(p).exists():
+                resolved.append(Item(uid=uid, path=Path(p)))
+        if len(resolved) >= 2:
+            outfits.append(resolved)
+        if len(outfits) >= args.max_outfits:
+            break
 
     if len(outfits) < 10:
         raise SystemExit("Not enough outfits with images to train")
 
-    pairs: list[Pair] = []
-    # Positive pairs: two items from same outfit.
-    for _ in range(args.pairs // 2):
-        items = random.choice(outfits)
-        a, b = random.sample(items, 2)
-        pairs.append(Pair(a=a, b=b, y=1))
-
-    # Negative pairs: items from different outfits.
-    for _ in range(args.pairs - len(pairs)):
-        o1, o2 = random.sample(outfits, 2)
-        a = random.choice(o1)
-        b = random.choice(o2)
-        pairs.append(Pair(a=a, b=b, y=0))
-
-    random.shuffle(pairs)
-
     import torch
     import torch.nn as nn
     import torch.optim as optim
-    from PIL import Image
-    from torchvision import models, transforms
+    from torchvision import models
 
     device = _choose_device()
     print(f"Using device: {device}")
     print(f"Outfits used: {len(outfits)}")
-    print(f"Pairs: {len(pairs)}")
-
-    tfm = transforms.Compose(
-        [
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ]
-    )
-
-    class DS(torch.utils.data.Dataset):
-        def __init__(self, pairs: list[Pair]):
-            self.pairs = pairs
-
-        def __len__(self):
-            return len(self.pairs)
 
-        def __getitem__(self, idx):
-            p = self.pairs[idx]
-            xa = tfm(Image.open(p.a).convert("RGB"))
-            xb = tfm(Image.open(p.b).convert("RGB"))
-            y = torch.tensor([p.y], dtype=torch.float32)
-            return xa, xb, y
-
-    dl = torch.utils.data.DataLoader(DS(pairs), batch_size=16, shuffle=True, num_workers=0)
+    if args.mode == "items":
+        ds = OutfitItemsDataset(outfits, max(2, args.items_per_outfit), cache)
+        dl = make_loader(
+            ds, args, device=device, batch_size=args.outfits_per_batch, shuffle=True, collate_fn=_collate_outfits
+        )
+        if args.bench_loader:
+            # Batches are already flat item tensors.
+            return bench_loader(dl, args.bench_loader)
+    else:
+        pairs: list[Pair] = []
+        # Positive pairs: two items from same outfit.
+        for _ in range(args.pairs // 2):
+            items = random.choice(outfits)
+            a, b = random.sample(items, 2)
+            pairs.append(Pair(a=a, b=b, y=1))
+
+        # Negative pairs: items from different outfits.
+        for _ in range(args.pairs - len(pairs)):
+            o1, o2 = random.sample(outfits, 2)
+            a = random.choice(o1)
+            b = random.choice(o2)
+            pairs.append(Pair(a=a, b=b, y=0))
+
+        random.shuffle(pairs)
+        print(f"Pairs: {len(pairs)}")
+
+        if store is not None:
+            return _train_heads_on_features(store, pairs, args, device)
+
+        dl = make_loader(PairDataset(pairs, cache), args, device=device, batch_size=16, shuffle=True)
+        if args.bench_loader:
+            return bench_loader(dl, args.bench_loader, images_per_sample=2)
 
     # Small siamese-ish model: shared backbone -> embedding -> pair classifier.
     backbone = models.resnet18(weights=None)
     backbone.fc = nn.Identity()
 
-    embed_dim = 256
-    proj = nn.Sequential(
-        nn.Linear(512, embed_dim),
-        nn.ReLU(),
-        nn.Linear(embed_dim, embed_dim),
-    )
-
-    head = nn.Sequential(
-        nn.Linear(embed_dim * 2, 128),
-        nn.ReLU(),
-        nn.Linear(128, 1),
-    )
+    proj, head = _build_heads(512)
 
     model = nn.Module()
     model.backbone = backbone
     model.proj = proj
     model.head = head
 
-    def forward(xa, xb):
-        ea = model.proj(model.backbone(xa))
-        eb = model.proj(model.backbone(xb))
-        z = torch.cat([ea, eb], dim=1)
-        return model.head(z)
+    def embed(x):
+        return model.proj(model.backbone(x))
+
+    def score(ea, eb):
+        return model.head(torch.cat([ea, eb], dim=1))
 
     model = model.to(device)
 
     opt = optim.Adam(model.parameters(), lr=1e-3)
     loss_fn = nn.BCEWithLogitsLoss()
 
+    meter = ThroughputMeter()
     for epoch in range(args.epochs):
         model.train()
         total_loss = 0.0
         correct = 0
         seen = 0
-        for xa, xb, y in dl:
-            xa = xa.to(device)
-            xb = xb.to(device)
+        backbone_images = 0
+        for batch in meter.wrap(dl):
+            opt.zero_grad(set_to_none=True)
+            if args.mode == "items":
+                x, owner = batch
+                # One backbone pass per unique item; pairs are gathered from the embeddings.
+                e = embed(x.to(device))
+                ia, ib, y = _in_batch_pairs(owner, args.neg_per_pos)
+                logits = score(e[ia.to(device)], e[ib.to(device)])
+                n_images = int(x.size(0))
+            else:
+                xa, xb, y = batch
+                logits = score(embed(xa.to(device)), embed(xb.to(device)))
+                n_images = 2 * int(xa.size(0))
             y = y.to(device)
 
-            opt.zero_grad(set_to_none=True)
-            logits = forward(xa, xb)
             loss = loss_fn(logits, y)
             loss.backward()
             opt.step()
 
-            total_loss += float(loss.item()) * int(xa.size(0))
+            total_loss += float(loss.item()) * int(y.size(0))
             pred = (torch.sigmoid(logits) >= 0.5).to(torch.float32)
             correct += int((pred == y).sum().item())
-            seen += int(xa.size(0))
-
-        print(f"epoch={epoch+1} loss={total_loss/seen:.4f} acc={correct/seen:.3f}")
+            seen += int(y.size(0))
+            backbone_images += n_images
+            meter.step(n_images)
+
+        print(
+            f"epoch={epoch+1} loss={total_loss/seen:.4f} acc={correct/seen:.3f} "
+            f"pairs={seen} backbone_images={backbone_images} pairs_per_image={seen/backbone_images:.2f}"
+        )
+
+    print(meter.summary())
+
+    if args.export_embeddings:
+        _export_embeddings(
+            Path(args.export_embeddings).expanduser().resolve(),
+            outfits_path,
+            model.proj,
+            model.head,
+            model.backbone,
+            None,
+            cache,
+            args,
+            device,
+            bad,
+        )
 
     print("Polyvore pairwise smoke train complete.")
     return 0
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Check that dataset images exist and decode, in parallel, and record the result.
+
+Inputs (any mix):
+- --item-images  polyvore_item_images.jsonl (+ --images-root), from index_polyvore_images.py
+- --dir          any image tree, e.g. Datasets/DeepFashion2/train/image (repeatable)
+
+Modes:
+  header  parse the JPEG/PNG header for width/height and check that the file
+          holds its end marker (JPEG EOI / PNG IEND). The marker is searched
+          backwards from the end, so trailers (maker notes, padding) after it
+          are fine. This catches missing, empty, truncated and garbage files,
+          usually reading one 64 KB block per image.
+  full    the header check, then a full PIL decode. A clean decode clears a
+          missing end marker, since PIL rejects truly truncated data anyway.
+          This is slower but also catches corrupt scan data.
+
+Files are checked by a process pool (--workers, default all cores). Each one
+gets a status of ok, missing, empty, truncated or corrupt. The report (--out,
+one ImageCheck row per image) is reused on re-runs: files whose size and
+mtime are unchanged keep their previous result unless a stronger mode is
+requested.
+
+Using the results:
+- --index-out rewrites the Polyvore image index with width/height/size/
+  status per row, and sets exists=false for missing images.
+- --size-cache adds the verified sizes to the image_size.py cache that the
+  COCO converter shares.
+- Trainers take `--image-status REPORT` and drop images whose status is not
+  ok before building samples, so a bad JPEG no longer crashes training
+  mid-epoch.
+
+Usage:
+  python3 tools/ml/verify_images.py \
+    --item-images tools/_out/manifests/polyvore_item_images.jsonl \
+    --images-root Datasets/polyvore_images \
+    --dir Datasets/DeepFashion2/train/image \
+    --out tools/_out/manifests/image_status.jsonl \
+    --mode full
+
+Requires: pillow (for --mode full and formats other than JPEG/PNG)
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+from image_size import ImageSizeCache, probe_stream_size
+from manifest_io import JsonlWriter
+from records import ImageCheck, ItemImage, iter_records, to_dict
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+_MODE_RANK = {"header": 0, "full": 1}
+# Block size for the backwards search for the JPEG EOI / PNG IEND marker.
+_TAIL_BLOCK = 64 * 1024
+
+
+def iter_image_files(root: str):
+    """Image files under `root`, recursively, in sorted order (os.scandir, no per-entry stat)."""
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        files, dirs = [], []
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir():
+                    dirs.append(e.path)
+                elif e.name.lower().endswith(IMAGE_EXTS) and e.is_file():
+                    files.append(e.path)
+        yield from sorted(files)
+        stack.extend(sorted(dirs, reverse=True))
+
+
+def _has_marker(f, size: int, marker: bytes, floor: int) -> bool:
+    """Whether `marker` occurs in the file at or after `floor`, searching back from the end."""
+    end = size
+    while end > floor:
+        start = max(floor, end - _TAIL_BLOCK)
+        f.seek(start)
+        # Read a little past `end` so a marker straddling two blocks is still seen.
+        if marker in f.read(end - start + len(marker) - 1):
+            return True
+        end = start
+    return False
+
+
+def _check_header(f, size: int):
+    dims = probe_stream_size(f)
+    # The JPEG probe stops just past the frame header; an EOI before that belongs to
+    # an embedded (EXIF) thumbnail, not to this image.
+    header_end = f.tell()
+    f.seek(0)
+    head = f.read(8)
+    if head[:2] == b"\xff\xd8":
+        if dims is None:
+            return "corrupt", None, None, "no JPEG frame header"
+        if not _has_marker(f, size, b"\xff\xd9", header_end):
+            return "truncated", dims[0], dims[1], "missing JPEG EOI marker"
+        return "ok", dims[0], dims[1], None
+    if head.startswith(b"\x89PNG"):
+        if dims is None:
+            return "corrupt", None, None, "bad PNG header"
+        if not _has_marker(f, size, b"IEND", 8):
+            return "truncated", dims[0], dims[1], "missing PNG IEND chunk"
+        return "ok", dims[0], dims[1], None
+    # Other formats: PIL reads only the header on open.
+    from PIL import Image
+
+    f.seek(0)
+    try:
+        with Image.open(f) as im:
+            return "ok", im.size[0], im.size[1], None
+    except Exception as e:  # noqa: BLE001 - any failure means undecodable
+        return "corrupt", None, None, f"{type(e).__name__}: {e}"
+
+
+def _check_full(path: str):
+    from PIL import Image
+
+    try:
+        with Image.open(path) as im:
+            im.load()
+            return "ok", im.size[0], im.size[1], None
+    except Exception as e:  # noqa: BLE001 - any failure means undecodable
+        msg = f"{type(e).__name__}: {e}"
+        return ("truncated" if "truncated" in msg else "corrupt"), None, None, msg
+
+
+def check_image(path: str, mode: str, prev: tuple | None = None) -> tuple | None:
+    """Verify one image.
+
+    Returns (status, bytes, mtime_ns, width, height, error), or None when
+    `prev` (bytes, mtime_ns, mode) shows that an earlier check still holds.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "missing", None, None, None, None, None
+    if prev is not None and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+        if _MODE_RANK[prev[2]] >= _MODE_RANK[mode]:
+            return None
+    if st.st_size == 0:
+        return "empty", 0, st.st_mtime_ns, None, None, None
+    try:
+        with open(path, "rb") as f:
+            status, w, h, err = _check_header(f, st.st_size)
+        # A clean decode overrides a missing end marker (e.g. an unusual trailer).
+        if mode == "full" and status in ("ok", "truncated"):
+            status, w, h, err = _check_full(path)
+    except OSError as e:
+        status, w, h, err = "corrupt", None, None, f"{type(e).__name__}: {e}"
+    return status, st.st_size, st.st_mtime_ns, w, h, err
+
+
+def _check_many(args: tuple) -> tuple | None:
+    return check_image(*args)
+
+
+def load_bad_paths(report: Path) -> set[str]:
+    """Paths whose last check in `report` was not ok."""
+    return {r.path for r in iter_records(report, ImageCheck) if r.status != "ok"}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--item-images", default="", help="Polyvore image index JSONL (needs --images-root)")
+    ap.add_argument("--images-root", default="", help="Root the --item-images relpaths are relative to")
+    ap.add_argument("--dir", action="append", default=[], help="Image directory to scan recursively (repeatable)")
+    ap.add_argument("--out", required=True, help="Status report JSONL (reused for unchanged files on re-runs)")
+    ap.add_argument("--mode", choices=sorted(_MODE_RANK), default="header")
+    ap.add_argument("--workers", type=int, default=0, help="Processes (0 = all cores)")
+    ap.add_argument("--index-out", default="", help="Write --item-images with width/height/size/status here")
+    ap.add_argument("--size-cache", default="", help="image_size.py cache JSON to add verified sizes to")
+    ap.add_argument("--show-bad", type=int, default=20, help="Print at most this many bad images")
+    args = ap.parse_args()
+
+    if not args.item_images and not args.dir:
+        raise SystemExit("Nothing to check: pass --item-images and/or --dir")
+    if args.item_images and not args.images_root:
+        raise SystemExit("--item-images needs --images-root")
+    if args.index_out and not args.item_images:
+        raise SystemExit("--index-out needs --item-images")
+
+    paths: list[str] = []
+    items: list[ItemImage] = []
+    if args.item_images:
+        images_root = Path(args.images_root).expanduser().resolve()
+        root_prefix = str(images_root) + os.sep
+        items = list(iter_records(Path(args.item_images).expanduser().resolve(), ItemImage))
+        paths.extend(root_prefix + it.image_relpath for it in items)
+    for d in args.dir:
+        root = Path(d).expanduser().resolve()
+        if not root.is_dir():
+            raise SystemExit(f"Not found: {root}")
+        paths.extend(iter_image_files(str(root)))
+
+    out_path = Path(args.out).expanduser().resolve()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    prev: dict[str, ImageCheck] = {}
+    if out_path.exists():
+        prev = {r.path: r for r in iter_records(out_path, ImageCheck)}
+
+    def _prev_key(p: str):
+        r = prev.get(p)
+        return (r.bytes, r.mtime_ns, r.mode) if r is not None and r.bytes is not None else None
+
+    jobs = [(p, args.mode, _prev_key(p)) for p in paths]
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    t0 = time.perf_counter()
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            raw = list(ex.map(_check_many, jobs, chunksize=256))
+    else:
+        raw = [_check_many(j) for j in jobs]
+    elapsed = time.perf_counter() - t0
+
+    results: dict[str, ImageCheck] = {}
+    reused = 0
+    checked_bytes = 0
+    for p, r in zip(paths, raw):
+        if r is None:
+            results[p] = prev[p]
+            reused += 1
+            continue
+        status, nbytes, mtime_ns, w, h, err = r
+        results[p] = ImageCheck(p, status, args.mode, nbytes, mtime_ns, w, h, err)
+        checked_bytes += nbytes or 0
+
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with JsonlWriter(tmp) as w:
+        w.write_many(to_dict(r) for r in results.values())
+    os.replace(tmp, out_path)
+
+    if args.index_out:
+        index_out = Path(args.index_out).expanduser().resolve()
+        index_out.parent.mkdir(parents=True, exist_ok=True)
+        with JsonlWriter(index_out) as w:
+            for it, p in zip(items, paths[: len(items)]):
+                r = results[p]
+                it.exists = r.status != "missing"
+                it.size, it.mtime_ns = r.bytes, r.mtime_ns
+                it.width, it.height, it.status = r.width, r.height, r.status
+                w.write(to_dict(it))
+        print(f"Wrote index with status: {index_out}")
+
+    if args.size_cache:
+        cache = ImageSizeCache(Path(args.size_cache).expanduser().resolve())
+        cache.update(
+            {p: [r.mtime_ns, r.bytes, r.width, r.height] for p, r in results.items() if r.status == "ok" and r.width}
+        )
+        cache.save()
+
+    counts = Counter(r.status for r in results.values())
+    checked = len(paths) - reused
+    print(f"Images: {len(results)} (checked {checked}, reused {reused}) mode={args.mode} workers={workers}")
+    print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    if elapsed > 0 and checked:
+        print(f"Throughput: {checked / elapsed:.0f} images/s, {checked_bytes / elapsed / 1e6:.1f} MB/s ({elapsed:.2f}s)")
+    bad = [r for r in results.values() if r.status != "ok"]
+    for r in bad[: args.show_bad]:
+        print(f"  {r.status:9s} {r.path}" + (f"  ({r.error})" if r.error else ""))
+    if len(bad) > args.show_bad:
+        print(f"  ... {len(bad) - args.show_bad} more in {out_path}")
+    print(f"Wrote: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Read files straight out of a (possibly encrypted) zip via a persisted entry index.
+
+Opening a big archive with zipfile/pyzipper parses the whole central
+directory into ZipInfo objects. For the DeepFashion2 train.zip that is
+hundreds of thousands of entries, and every DataLoader worker would repeat
+it. ZipEntryIndex does the parse once and saves the result next to the
+archive as memory-mappable .npy columns (<zip>.entries/):
+
+  names        (N,) sorted entry names (bytes)
+  data_offset  (N,) byte offset of the entry's data (past the local header)
+  compress_size, file_size, method, flags   (N,)
+  meta.json    archive size/mtime the index was built from (rebuilt if stale)
+
+Lookups are a binary search over `names`. Unencrypted entries are read with a
+single os.pread at data_offset and inflated if needed, with no zipfile
+objects. Encrypted entries are decrypted by a pyzipper handle. Each process
+opens its own handle lazily, on the first encrypted read. The index pickles
+without its file handles, so DataLoader and process-pool workers each reopen
+their own.
+
+Usage:
+  from zip_entries import ZipEntryIndex, zip_password
+  idx = ZipEntryIndex(Path("train.zip"), zip_password(""))
+  data = idx.read("train/image/000001.jpg")
+
+  # or build/refresh the index ahead of time:
+  python3 tools/ml/zip_entries.py /path/to/train.zip
+
+Requires: numpy, pyzipper (for encrypted entries)
+"""
+
+from __future__ import annotations
+
+import argparse
+import getpass
+import io
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+
+INDEX_VERSION = 1
+
+# Local file header: signature, versions/flags/method/time/date, crc, sizes, name/extra lengths.
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_LOCAL_SIG = b"PK\x03\x04"
+
+_COLUMNS = ("names", "data_offset", "compress_size", "file_size", "method", "flags")
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+def zip_password(arg: str) -> bytes:
+    """--password, else $DEEPFASHION2_ZIP_PASSWORD, else prompt."""
+    password = arg or os.environ.get("DEEPFASHION2_ZIP_PASSWORD", "")
+    if not password:
+        password = getpass.getpass("Zip password: ")
+    return password.encode("utf-8")
+
+
+def open_zip(path: Path, password: bytes = b""):
+    try:
+        import pyzipper
+    except ImportError as e:
+        raise SystemExit("Missing dependency 'pyzipper'. Install with: pip install pyzipper") from e
+    zf = pyzipper.AESZipFile(path)
+    if password:
+        zf.setpassword(password)
+    return zf
+
+
+def _stamp(path: Path) -> dict:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def build_entry_index(zip_path: Path, index_dir: Path) -> None:
+    """Parse the central directory once and write the .npy columns (atomically)."""
+    import numpy as np
+
+    with open_zip(zip_path) as zf:
+        infos = sorted((i for i in zf.infolist() if not i.is_dir()), key=lambda i: i.filename)
+        fp = zf.fp
+        data_offset = np.empty(len(infos), dtype=np.int64)
+        for k, info in enumerate(infos):
+            fp.seek(info.header_offset)
+            header = fp.read(_LOCAL_HEADER.size)
+            fields = _LOCAL_HEADER.unpack(header)
+            if fields[0] != _LOCAL_SIG:
+                raise SystemExit(f"{zip_path}: bad local header for {info.filename}")
+            data_offset[k] = info.header_offset + _LOCAL_HEADER.size + fields[9] + fields[10]
+
+    cols = {
+        "names": np.array([i.filename.encode("utf-8") for i in infos], dtype=bytes),
+        "data_offset": data_offset,
+        "compress_size": np.array([i.compress_size for i in infos], dtype=np.int64),
+        "file_size": np.array([i.file_size for i in infos], dtype=np.int64),
+        "method": np.array([i.compress_type for i in infos], dtype=np.int16),
+        "flags": np.array([i.flag_bits for i in infos], dtype=np.int32),
+    }
+    tmp = index_dir.with_name(index_dir.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for name, arr in cols.items():
+        np.save(tmp / f"{name}.npy", arr)
+    with (tmp / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "zip": str(zip_path), **_stamp(zip_path)}, f)
+    if index_dir.exists():
+        for p in index_dir.iterdir():
+            p.unlink()
+        index_dir.rmdir()
+    os.replace(tmp, index_dir)
+
+
+def _index_is_fresh(zip_path: Path, index_dir: Path) -> bool:
+    meta_path = index_dir / "meta.json"
+    if not meta_path.exists():
+        return False
+    with meta_path.open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta.get("version") == INDEX_VERSION and {k: meta.get(k) for k in ("size", "mtime_ns")} == _stamp(zip_path)
+
+
+class ZipEntryIndex:
+    """Memory-mapped entry table for one archive, with per-process read handles."""
+
+    def __init__(self, zip_path: Path, password: bytes = b"", index_dir: Path | None = None):
+        self.zip_path = zip_path
+        self.password = password
+        self.index_dir = index_dir or zip_path.with_name(zip_path.name + ".entries")
+        if not _index_is_fresh(zip_path, self.index_dir):
+            build_entry_index(zip_path, self.index_dir)
+        self._cols = self._load_cols()
+        self._fd: int | None = None
+        self._zf = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_cols"] = None
+        state["_fd"] = None
+        state["_zf"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cols = self._load_cols()
+
+    def _load_cols(self) -> dict:
+        import numpy as np
+
+        return {name: np.load(self.index_dir / f"{name}.npy", mmap_mode="r") for name in _COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self._cols["names"])
+
+    def _row(self, name: str) -> int:
+        import numpy as np
+
+        names = self._cols["names"]
+        key = name.encode("utf-8")
+        i = int(np.searchsorted(names, key))
+        if i < len(names) and names[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, name: str) -> bool:
+        return self._row(name) >= 0
+
+    def names(self, prefix: str = "", suffix: str = "") -> list[str]:
+        """Sorted entry names under `prefix` (and ending with `suffix`)."""
+        import numpy as np
+
+        names = self._cols["names"]
+        p = prefix.encode("utf-8")
+        lo = int(np.searchsorted(names, p))
+        # Every name starting with p sorts before p + 0xFF.
+        hi = int(np.searchsorted(names, p + b"\xff"))
+        out = [n.decode("utf-8") for n in names[lo:hi]]
+        return [n for n in out if n.endswith(suffix)] if suffix else out
+
+    def file_size(self, name: str) -> int:
+        return int(self._cols["file_size"][self._require(name)])
+
+    def _require(self, name: str) -> int:
+        i = self._row(name)
+        if i < 0:
+            raise KeyError(f"{name} not in {self.zip_path}")
+        return i
+
+    def _handle(self):
+        if self._zf is None:
+            self._zf = open_zip(self.zip_path, self.password)
+        return self._zf
+
+    def read(self, name: str) -> bytes:
+        i = self._require(name)
+        method = int(self._cols["method"][i])
+        if int(self._cols["flags"][i]) & 0x1 or method not in (ZIP_STORED, ZIP_DEFLATED):
+            # Encrypted (ZipCrypto/AES) or an unusual codec: let pyzipper handle it.
+            return self._handle().read(name)
+        if self._fd is None:
+            self._fd = os.open(self.zip_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        raw = os.pread(self._fd, int(self._cols["compress_size"][i]), int(self._cols["data_offset"][i]))
+        if method == ZIP_DEFLATED:
+            raw = zlib.decompress(raw, -15)
+        return raw
+
+    def open(self, name: str):
+        """Binary file object for `name`. Encrypted entries stream, so a header probe
+        only decrypts the first few KB."""
+        i = self._require(name)
+        if int(self._cols["flags"][i]) & 0x1:
+            return self._handle().open(name)
+        return io.BytesIO(self.read(name))
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("zips", nargs="+", help="Archives to (re)index")
+    ap.add_argument("--force", action="store_true", help="Rebuild even if the index is up to date")
+    args = ap.parse_args()
+
+    for z in args.zips:
+        zip_path = Path(z).expanduser().resolve()
+        index_dir = zip_path.with_name(zip_path.name + ".entries")
+        if args.force or not _index_is_fresh(zip_path, index_dir):
+            build_entry_index(zip_path, index_dir)
+        idx = ZipEntryIndex(zip_path)
+        print(f"{zip_path.name}: {len(idx)} entries -> {index_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())